@@ -1,18 +1,29 @@
-from fastmcp import FastMCP
+import os
+import anyio
+from mcp_logging import configure_server_logging
+# 在导入 fastmcp 之前接管日志，导入期间的警告（如 AuthlibDeprecationWarning）也输出为 JSON 记录
+configure_server_logging()
+from fastmcp import Context, FastMCP
+from mcp_tracing import configure_tracing, get_tracer, traced_tool
+from mcp_metrics import instrumented_tool, register_metrics, timed_upstream
+from mcp_progress import report_progress
 import boto3
 from botocore.exceptions import ClientError
 from typing import Annotated
 from pydantic import Field
-import time
 
 mcp = FastMCP("AWS EC2 Controller")
+configure_tracing("aws_mcp_server")
+register_metrics(mcp)
 
 # 初始化EC2客户端
 ec2 = boto3.client('ec2', region_name='ap-northeast-1')
 instance_id = 'i-07e3eba501133ef6a'
 
-@mcp.tool()
-def start_ec2_instance(
+@mcp.tool(annotations={"readOnlyHint": False, "destructiveHint": False, "idempotentHint": True, "openWorldHint": True})
+@instrumented_tool
+@traced_tool
+async def start_ec2_instance(
     max_retries: Annotated[
         int,
         Field(
@@ -28,7 +39,8 @@ def start_ec2_instance(
             ge=1,
             le=60
         )
-    ] = 1
+    ] = 1,
+    ctx: Context | None = None
 ) -> dict:
     """启动AWS EC2实例
     
@@ -39,8 +51,14 @@ def start_ec2_instance(
     """
     retries = 0
     while retries < max_retries:
+        await report_progress(ctx, retries, max_retries, f"第 {retries + 1}/{max_retries} 次尝试启动实例 {instance_id}")
         try:
-            response = ec2.start_instances(InstanceIds=[instance_id])
+            with get_tracer().start_span("ec2.start_instances", {"attempt": retries + 1}), \
+                    timed_upstream("ec2", "start_instances"):
+                # boto3 是同步调用，放到线程中执行，重试等待期间不阻塞其他请求
+                response = await anyio.to_thread.run_sync(
+                    lambda: ec2.start_instances(InstanceIds=[instance_id])
+                )
             current_state = response['StartingInstances'][0]['CurrentState']['Name']
             return {
                 "success": True,
@@ -54,7 +72,8 @@ def start_ec2_instance(
             if error_code == 'InsufficientInstanceCapacity':
                 retries += 1
                 if retries < max_retries:
-                    time.sleep(wait_seconds)
+                    await report_progress(ctx, retries, max_retries, f"容量不足，{wait_seconds} 秒后重试")
+                    await anyio.sleep(wait_seconds)
                     continue
                 else:
                     return {
@@ -87,7 +106,9 @@ def start_ec2_instance(
         "instance_id": instance_id
     }
 
-@mcp.tool()
+@mcp.tool(annotations={"readOnlyHint": False, "destructiveHint": True, "idempotentHint": True, "openWorldHint": True})
+@instrumented_tool
+@traced_tool
 def stop_ec2_instance() -> dict:
     """停止AWS EC2实例
     
@@ -96,7 +117,8 @@ def stop_ec2_instance() -> dict:
     返回停止结果和当前实例状态信息。
     """
     try:
-        response = ec2.stop_instances(InstanceIds=[instance_id])
+        with get_tracer().start_span("ec2.stop_instances"), timed_upstream("ec2", "stop_instances"):
+            response = ec2.stop_instances(InstanceIds=[instance_id])
         current_state = response['StoppingInstances'][0]['CurrentState']['Name']
         return {
             "success": True,
@@ -119,7 +141,10 @@ def stop_ec2_instance() -> dict:
             "instance_id": instance_id
         }
 
-@mcp.tool()
+# 实例状态随时在变，提示客户端不要缓存
+@mcp.tool(annotations={"readOnlyHint": True, "openWorldHint": True, "cacheTtlSeconds": 0})
+@instrumented_tool
+@traced_tool
 def get_ec2_instance_status() -> dict:
     """获取AWS EC2实例当前状态
     
@@ -128,7 +153,8 @@ def get_ec2_instance_status() -> dict:
     返回实例的详细状态信息。
     """
     try:
-        response = ec2.describe_instances(InstanceIds=[instance_id])
+        with get_tracer().start_span("ec2.describe_instances"), timed_upstream("ec2", "describe_instances"):
+            response = ec2.describe_instances(InstanceIds=[instance_id])
         state = response['Reservations'][0]['Instances'][0]['State']['Name']
         return {
             "success": True,
@@ -145,4 +171,15 @@ def get_ec2_instance_status() -> dict:
         }
 
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    # 默认 stdio；设置 MCP_TRANSPORT=streamable-http 或 sse 可作为共享远程服务器运行
+    transport = os.environ.get("MCP_TRANSPORT", "stdio")
+    # 再配置一次以移除 fastmcp 导入时挂上的 RichHandler
+    configure_server_logging()
+    if transport == "stdio":
+        mcp.run()
+    else:
+        mcp.run(
+            transport=transport,
+            host=os.environ.get("MCP_HOST", "127.0.0.1"),
+            port=int(os.environ.get("MCP_PORT", "8000"))
+        )
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""多会话网关负载测试
+
+在本地替身服务（benchmarks/fakes.py）上启动 MCPGateway，让 --sessions 个会话
+同时进行，每个会话依次发送 --turns 轮对话，统计每秒完成的会话数、每秒轮次数
+以及单轮延迟分布。
+
+用法:
+    python benchmarks/bench_gateway.py --sessions 200 --turns 3 --max-concurrency 32 --ttft-ms 50
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import start_fake_services
+from mcp_logging import configure_logging
+from mcp_tracing import Histogram, configure_tracing
+
+QUERIES = [
+    "今天有什么动漫播出？",
+    "帮我查看星期一的番剧安排",
+    "星期五有什么好看的番剧？",
+]
+
+
+async def run_session(gateway, session_id, turns, errors):
+    for i in range(turns):
+        try:
+            await gateway.run_turn(session_id, QUERIES[i % len(QUERIES)])
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+    gateway.close_session(session_id)
+
+
+async def run_load(router, sessions, turns, max_concurrency, pool_size):
+    from mcp_gateway import MCPGateway
+
+    gateway = MCPGateway(router, max_concurrency=max_concurrency, pool_size=pool_size)
+    errors = {}
+    session_latency = Histogram()
+
+    async def timed_session(index):
+        started = time.perf_counter()
+        await run_session(gateway, f"bench-{index}", turns, errors)
+        session_latency.record((time.perf_counter() - started) * 1000)
+
+    try:
+        # 预热：建立连接、转换工具列表
+        await gateway.run_turn("warmup", QUERIES[0])
+        gateway.close_session("warmup")
+        gateway.turn_latency = Histogram()
+        gateway.completed = 0
+
+        started = time.perf_counter()
+        await asyncio.gather(*(timed_session(i) for i in range(sessions)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await gateway.aclose()
+
+    return {
+        "sessions": sessions,
+        "turns_per_session": turns,
+        "max_concurrency": max_concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "sessions_per_sec": round(sessions / elapsed, 2),
+        "turns_per_sec": round(gateway.completed / elapsed, 2),
+        "completed_turns": gateway.completed,
+        "errors": errors,
+        "turn_latency": gateway.turn_latency.summary(),
+        "session_latency": session_latency.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话网关负载测试")
+    parser.add_argument("--sessions", type=int, default=100, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的轮次数")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="网关同时执行的轮次上限")
+    parser.add_argument("--pool-size", type=int, default=64, help="Anthropic API 连接池大小")
+    parser.add_argument("--ttft-ms", type=float, default=0, help="替身模型的首 token 延迟")
+    parser.add_argument("--event-interval-ms", type=float, default=0, help="替身模型的事件间隔")
+    parser.add_argument("--upstream-latency-ms", type=float, default=0, help="替身 bgm.tv / EC2 的响应延迟")
+    parser.add_argument("--follow-up-tool-rounds", type=int, default=0,
+                        help="替身模型在 follow_up 中继续请求工具的次数（检查历史中 tool_use 的配对）")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    configure_logging(level="WARNING")
+    configure_tracing("bench_gateway")
+    services = start_fake_services(
+        ttft_ms=args.ttft_ms,
+        event_interval_ms=args.event_interval_ms,
+        bgm_latency_ms=args.upstream_latency_ms,
+        ec2_latency_ms=args.upstream_latency_ms,
+        follow_up_tool_rounds=args.follow_up_tool_rounds,
+    )
+    from mcp_gateway import create_router
+
+    router = create_router(ROOT)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            router.start_server()
+        result = asyncio.run(run_load(router, args.sessions, args.turns, args.max_concurrency, args.pool_size))
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            router.stop_server()
+        services.stop()
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    latency = result["turn_latency"]
+    print(f"会话: {result['sessions']} x {result['turns_per_session']} 轮，并发上限 {result['max_concurrency']}")
+    print(f"耗时: {result['elapsed_s']}s，{result['sessions_per_sec']} sessions/sec，{result['turns_per_sec']} turns/sec")
+    print(f"单轮延迟: p50 {latency['p50_ms']} ms，p99 {latency['p99_ms']} ms，max {latency['max_ms']} ms")
+    if result["errors"]:
+        print(f"错误: {result['errors']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""MCPStdioClient stdio 吞吐量基准测试
+
+通过本地回显服务器测量不同编解码器、不同负载大小下的 messages/sec 和 MB/s。
+
+用法:
+    python benchmarks/bench_stdio_throughput.py
+    python benchmarks/bench_stdio_throughput.py --codec json --sizes 1024 1048576 --log-payloads
+    python benchmarks/bench_stdio_throughput.py --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mcp_client import MCPStdioClient
+from mcp_codec import available_codecs, get_codec
+from mcp_logging import configure_logging
+
+
+def run_case(codec_name, size, count, log_payloads=False):
+    """对单个 编解码器 x 负载大小 组合测量往返吞吐量"""
+    os.environ["MCP_JSON_CODEC"] = codec_name  # 回显服务器使用同一个编解码器
+    mcp_client = MCPStdioClient(
+        server_script_path="echo_server.py",
+        cwd=os.path.join(ROOT, "benchmarks"),
+        codec=codec_name
+    )
+    if not mcp_client.start_server() or not mcp_client.initialize():
+        raise RuntimeError("回显服务器启动失败")
+
+    params = {"name": "echo", "arguments": {"text": "番" * (size // 3)}}
+    request_bytes = len(get_codec(codec_name).dumps(params))
+    try:
+        for _ in range(min(count, 20)):  # 预热
+            mcp_client.send_request("tools/call", params)
+
+        start = time.perf_counter()
+        for _ in range(count):
+            response = mcp_client.send_request("tools/call", params)
+            if response is None:
+                raise RuntimeError("请求超时")
+        elapsed = time.perf_counter() - start
+    finally:
+        mcp_client.stop_server()
+
+    return {
+        "codec": codec_name,
+        "payload_bytes": request_bytes,
+        "messages": count,
+        "log_payloads": log_payloads,
+        "seconds": round(elapsed, 4),
+        "messages_per_sec": round(count / elapsed, 1),
+        # 请求和响应各传输一次负载
+        "mb_per_sec": round(2 * request_bytes * count / elapsed / 1e6, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCPStdioClient stdio 吞吐量基准测试")
+    parser.add_argument("--codec", nargs="*", default=available_codecs(), help="要测试的编解码器")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[256, 16 * 1024, 1024 * 1024], help="负载大小（字节）")
+    parser.add_argument("--count", type=int, default=500, help="每组测量的消息数（1MB 负载会自动减少）")
+    parser.add_argument("--log-payloads", action="store_true", help="开启完整负载日志，用于对比日志开销")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    configure_logging(level="WARNING", stream=open(os.devnull, "w"))
+    if args.log_payloads:
+        # 只打开负载日志，输出到 /dev/null，测量的是格式化本身的开销
+        logging.getLogger("mcp_client.payload").setLevel(logging.DEBUG)
+
+    results = []
+    for codec_name in args.codec:
+        for size in args.sizes:
+            count = max(20, min(args.count, args.count * 16 * 1024 // size))
+            results.append(run_case(codec_name, size, count, args.log_payloads))
+
+    print("\n📊 stdio 吞吐量")
+    print(f"{'codec':<10}{'payload':>12}{'msgs':>8}{'msg/s':>12}{'MB/s':>10}")
+    for r in results:
+        print(f"{r['codec']:<10}{r['payload_bytes']:>12}{r['messages']:>8}{r['messages_per_sec']:>12}{r['mb_per_sec']:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""最小的 stdio JSON-RPC 回显服务器，用于测量客户端侧的编解码与管道开销"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcp_codec import get_codec
+
+
+def main():
+    codec = get_codec()
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    for line in stdin:
+        message = codec.loads(line)
+        if "id" not in message:
+            continue  # 通知无需响应
+        if message["method"] == "initialize":
+            result = {
+                "protocolVersion": message["params"].get("protocolVersion"),
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": "echo", "version": "1.0.0"}
+            }
+        elif message["method"] == "tools/list":
+            result = {"tools": [{"name": "echo", "inputSchema": {"type": "object"}}]}
+        elif message["method"] == "tools/call":
+            # 以工具结果的形式把参数原样返回
+            result = {"content": [{"type": "text", "text": message["params"]["arguments"].get("text", "")}]}
+        else:
+            result = message.get("params", {})
+        stdout.write(codec.dumps({"jsonrpc": "2.0", "id": message["id"], "result": result}))
+        stdout.write(b"\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""基准测试用的本地替身服务
+
+- FakeAnthropicHandler: 回放录制好的 Messages 流式事件（/v1/messages）
+- FakeBgmHandler: 返回固定的 api.bgm.tv/calendar 数据
+- FakeEC2Handler: 以 EC2 Query API 的 XML 格式响应 Start/Stop/DescribeInstances
+
+start_fake_services() 在后台线程中启动三个服务，并返回需要注入到客户端和
+MCP 服务器子进程中的环境变量（ANTHROPIC_BASE_URL、BGM_API_URL、
+AWS_ENDPOINT_URL_EC2 等）。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+
+def load_recording(name):
+    with open(os.path.join(RECORDINGS_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，与真实服务一致
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeAnthropicHandler(_QuietHandler):
+    """回放录制的流式事件
+
+    最后一条用户消息包含 tool_result 时回放最终回答，否则回放一次工具调用；
+    工具名取请求 tools 中第一个以 get_anime_calendar 结尾的工具。
+    server.follow_up_tool_rounds 大于 0 时，本轮的前几次 follow_up 仍然回放工具调用，
+    用于模拟模型在拿到工具结果后继续请求工具。
+    server.ttft_ms / server.event_interval_ms 用于模拟模型延迟。
+
+    与真实 API 一样，历史中的 tool_use 没有紧跟对应的 tool_result 时返回 400。
+    """
+
+    def do_POST(self):
+        request = json.loads(self._read_body())
+        messages = request.get("messages", [])
+        error = _unpaired_tool_use(messages)
+        if error:
+            body = {"type": "error", "error": {"type": "invalid_request_error", "message": error}}
+            self._send(400, json.dumps(body).encode("utf-8"), "application/json")
+            return
+        # 本轮（最后一条普通用户提问之后）已经返回过的工具结果数
+        tool_rounds = 0
+        for message in reversed(messages):
+            if message["role"] == "user" and isinstance(message["content"], str):
+                break
+            if message["role"] == "user":
+                tool_rounds += 1
+        tool_name = next(
+            (tool["name"] for tool in request.get("tools", []) if tool["name"].endswith("get_anime_calendar")),
+            None
+        )
+        use_tool = tool_name is not None and tool_rounds <= self.server.follow_up_tool_rounds
+        recording = self.server.tool_use if use_tool else self.server.final
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        first_delta = True
+        for event in recording:
+            if event["event"] == "content_block_delta":
+                delay = self.server.ttft_ms if first_delta else self.server.event_interval_ms
+                first_delta = False
+                if delay:
+                    time.sleep(delay / 1000)
+            data = json.dumps(event["data"], ensure_ascii=False)
+            if tool_name:
+                data = data.replace("{{tool_name}}", tool_name)
+            chunk = f"event: {event['event']}\ndata: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def _unpaired_tool_use(messages):
+    """返回第一个没有对应 tool_result 的 tool_use 的错误信息"""
+    for i, message in enumerate(messages):
+        if message["role"] != "assistant" or not isinstance(message["content"], list):
+            continue
+        ids = {block["id"] for block in message["content"] if block.get("type") == "tool_use"}
+        if not ids:
+            continue
+        following = messages[i + 1]["content"] if i + 1 < len(messages) else []
+        answered = {block.get("tool_use_id") for block in following if isinstance(block, dict)} \
+            if isinstance(following, list) else set()
+        if ids - answered:
+            return f"messages.{i}: tool_use ids were found without tool_result blocks immediately after"
+    return None
+
+
+class FakeBgmHandler(_QuietHandler):
+    """固定返回录制的番剧日历，server.latency_ms 模拟上游延迟"""
+
+    def do_GET(self):
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000)
+        self._send(200, self.server.calendar, "application/json")
+
+
+class FakeEC2Handler(_QuietHandler):
+    """EC2 Query API 替身，实例状态保存在内存中"""
+
+    def do_POST(self):
+        params = parse_qs(self._read_body().decode())
+        action = params.get("Action", [""])[0]
+        instance_id = params.get("InstanceId.1", ["i-00000000000000000"])[0]
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000)
+
+        previous = self.server.state
+        if action == "StartInstances":
+            self.server.state = "pending"
+            body = self._state_change("StartInstancesResponse", "instancesSet", instance_id, previous)
+        elif action == "StopInstances":
+            self.server.state = "stopping"
+            body = self._state_change("StopInstancesResponse", "instancesSet", instance_id, previous)
+        elif action == "DescribeInstances":
+            body = f"""<DescribeInstancesResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+  <requestId>bench</requestId>
+  <reservationSet><item><reservationId>r-bench</reservationId><instancesSet><item>
+    <instanceId>{instance_id}</instanceId>
+    <instanceState><code>16</code><name>{self.server.state}</name></instanceState>
+  </item></instancesSet></item></reservationSet>
+</DescribeInstancesResponse>"""
+        else:
+            self._send(400, f"<Response><Errors><Error><Code>InvalidAction</Code><Message>{action}</Message></Error></Errors></Response>".encode(), "text/xml")
+            return
+        self._send(200, body.encode(), "text/xml")
+
+    def _state_change(self, root, set_name, instance_id, previous):
+        return f"""<{root} xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">
+  <requestId>bench</requestId>
+  <{set_name}><item>
+    <instanceId>{instance_id}</instanceId>
+    <currentState><code>0</code><name>{self.server.state}</name></currentState>
+    <previousState><code>80</code><name>{previous}</name></previousState>
+  </item></{set_name}>
+</{root}>"""
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭 keep-alive 连接属于正常情况，不打印 traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeServices:
+    """后台运行的替身服务集合"""
+
+    def __init__(self, ttft_ms=0, event_interval_ms=0, bgm_latency_ms=0, ec2_latency_ms=0,
+                 follow_up_tool_rounds=0):
+        self.anthropic = _QuietServer(("127.0.0.1", 0), FakeAnthropicHandler)
+        self.anthropic.tool_use = load_recording("messages_tool_use.json")
+        self.anthropic.final = load_recording("messages_final.json")
+        self.anthropic.ttft_ms = ttft_ms
+        self.anthropic.event_interval_ms = event_interval_ms
+        self.anthropic.follow_up_tool_rounds = follow_up_tool_rounds
+
+        self.bgm = _QuietServer(("127.0.0.1", 0), FakeBgmHandler)
+        with open(os.path.join(RECORDINGS_DIR, "bgm_calendar.json"), "rb") as f:
+            self.bgm.calendar = f.read()
+        self.bgm.latency_ms = bgm_latency_ms
+
+        self.ec2 = _QuietServer(("127.0.0.1", 0), FakeEC2Handler)
+        self.ec2.state = "stopped"
+        self.ec2.latency_ms = ec2_latency_ms
+
+        self._servers = [self.anthropic, self.bgm, self.ec2]
+        for server in self._servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def _url(server):
+        host, port = server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def env(self):
+        """注入客户端进程和 MCP 服务器子进程的环境变量"""
+        return {
+            "ANTHROPIC_BASE_URL": self._url(self.anthropic),
+            "ANTHROPIC_API_KEY": "sk-ant-bench",
+            "BGM_API_URL": self._url(self.bgm) + "/calendar",
+            "AWS_ENDPOINT_URL_EC2": self._url(self.ec2),
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+            "AWS_DEFAULT_REGION": "ap-northeast-1",
+        }
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+
+def start_fake_services(**kwargs):
+    """启动替身服务并把环境变量写入 os.environ（子进程会继承）"""
+    services = FakeServices(**kwargs)
+    os.environ.update(services.env)
+    return services
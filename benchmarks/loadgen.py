@@ -0,0 +1,460 @@
+"""MCP 服务器负载生成器
+
+以目标速率（rate，开环：按计划时间发出请求，延迟从计划时间算起，不受排队掩盖）
+或目标并发（concurrency，闭环：N 个工作线程循环调用）驱动 tools/call，
+上游 bgm.tv / EC2 由 benchmarks/fakes.py 的本地替身提供。支持 stdio、
+streamable-http 和 sse 三种传输。
+
+报告内容：
+- 吞吐量、延迟分位数、按类型统计的错误（timeout / rpc_<code> / tool_error）；
+- 服务器进程的 RSS、CPU 占用和线程数随时间的变化（读取 /proc）；
+- 事件循环探针：负载期间每隔 --probe-interval-ms 发送一次 ping，ping 在服务器
+  事件循环中处理，负载下 ping 延迟远高于空闲时说明有同步调用阻塞了事件循环
+  （例如同步工具中的 requests.get / time.sleep / boto3 调用）。
+
+场景文件（JSON）可以定义调用组合和多个阶段，命令行参数会覆盖场景中的同名设置：
+
+    {
+      "server": "anime",
+      "transport": "stdio",
+      "env": {"BGM_CACHE_TTL": "0"},
+      "upstream_latency_ms": 20,
+      "calls": [{"tool": "get_anime_calendar", "arguments": {"weekday": 1}, "weight": 3},
+                {"tool": "get_anime_calendar", "arguments": {}, "weight": 1}],
+      "stages": [{"mode": "rate", "rate": 50, "duration": 5},
+                 {"mode": "concurrency", "concurrency": 16, "duration": 5}]
+    }
+
+用法:
+    python benchmarks/loadgen.py --server anime --mode concurrency --concurrency 16 --duration 10
+    python benchmarks/loadgen.py --server ec2 --tool get_ec2_instance_status --transport streamable-http --mode rate --rate 100
+    python benchmarks/loadgen.py --scenario benchmarks/scenarios/anime_ramp.json --output load.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import start_fake_services
+from mcp_logging import configure_logging
+from mcp_tracing import Histogram
+
+SERVERS = {
+    "anime": "mcp_server.py",
+    "ec2": "aws_mcp_server.py",
+}
+
+DEFAULT_TOOLS = {
+    "anime": "get_anime_calendar",
+    "ec2": "get_ec2_instance_status",
+}
+
+DEFAULT_SCENARIO = {
+    "server": "anime",
+    "transport": "stdio",
+    "env": {},
+    "upstream_latency_ms": 0,
+    "timeout": 10,
+    "probe_interval_ms": 100,
+    "sample_interval": 1.0,
+    "max_workers": 256,
+    "calls": None,
+    "stages": [{"mode": "concurrency", "concurrency": 8, "duration": 10}],
+}
+
+
+def load_scenario(args):
+    """合并默认值、场景文件和命令行参数"""
+    scenario = dict(DEFAULT_SCENARIO)
+    if args.scenario:
+        with open(args.scenario, encoding="utf-8") as f:
+            scenario.update(json.load(f))
+    for key in ("server", "transport", "upstream_latency_ms", "timeout", "probe_interval_ms",
+                "sample_interval", "max_workers"):
+        value = getattr(args, key)
+        if value is not None:
+            scenario[key] = value
+    if args.tool or args.arguments:
+        scenario["calls"] = [{
+            "tool": args.tool or DEFAULT_TOOLS[scenario["server"]],
+            "arguments": json.loads(args.arguments) if args.arguments else {},
+        }]
+    if not scenario["calls"]:
+        scenario["calls"] = [{"tool": DEFAULT_TOOLS[scenario["server"]], "arguments": {}}]
+    if args.mode:
+        scenario["stages"] = [{
+            "mode": args.mode,
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+        }]
+    return scenario
+
+
+class ProcSampler:
+    """读取 /proc/<pid> 中的 RSS、CPU 时间和线程数（非 Linux 平台返回 None）"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.last = None
+
+    def sample(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # comm 字段可能包含空格，从最后一个 ')' 之后开始解析
+                fields = f.read().rpartition(")")[2].split()
+            with open(f"/proc/{self.pid}/status") as f:
+                rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration, ValueError):
+            return None
+        # fields[0] 是 state（stat 第 3 个字段），utime/stime/num_threads 为第 14/15/20 个字段
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self.ticks
+        now = time.monotonic()
+        cpu_pct = None
+        if self.last:
+            cpu_pct = round((cpu_seconds - self.last[1]) / (now - self.last[0]) * 100, 1)
+        self.last = (now, cpu_seconds)
+        return {"rss_mb": round(rss_kb / 1024, 1), "cpu_pct": cpu_pct, "threads": int(fields[17])}
+
+
+class Window:
+    """一个采样周期内的统计"""
+
+    def __init__(self):
+        self.completed = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.ping = Histogram()
+
+
+class LoadRun:
+    """在一个已连接的客户端上执行各个阶段并收集统计"""
+
+    def __init__(self, mcp_client, scenario, sampler):
+        self.mcp_client = mcp_client
+        self.calls = scenario["calls"]
+        self.weights = [call.get("weight", 1) for call in self.calls]
+        self.timeout = scenario["timeout"]
+        self.probe_interval = scenario["probe_interval_ms"] / 1000
+        self.sample_interval = scenario["sample_interval"]
+        self.max_workers = scenario["max_workers"]
+        self.sampler = sampler
+        self.timeline = []
+        self._lock = threading.Lock()
+
+    def _reset_stage(self):
+        self.latency = Histogram()
+        self.ping = Histogram()
+        self.errors = {}
+        self.ok = 0
+        self.window = Window()
+
+    def _record(self, latency_ms, error):
+        with self._lock:
+            window = self.window
+            window.completed += 1
+            if error:
+                window.errors += 1
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.ok += 1
+        self.latency.record(latency_ms)
+        window.latency.record(latency_ms)
+
+    def call_once(self, started=None):
+        """发出一次 tools/call；started 为计划发出时间（rate 模式），延迟从该时间算起"""
+        call = random.choices(self.calls, self.weights)[0] if len(self.calls) > 1 else self.calls[0]
+        started = started or time.perf_counter()
+        response = self.mcp_client.send_request(
+            "tools/call", {"name": call["tool"], "arguments": call.get("arguments", {})}, timeout=self.timeout
+        )
+        latency_ms = (time.perf_counter() - started) * 1000
+        if response is None:
+            error = "timeout"
+        elif "error" in response:
+            error = f"rpc_{response['error'].get('code')}"
+        elif response.get("result", {}).get("isError"):
+            error = "tool_error"
+        else:
+            error = None
+        self._record(latency_ms, error)
+
+    def ping_once(self):
+        started = time.perf_counter()
+        response = self.mcp_client.send_request("ping", timeout=self.timeout)
+        if response is not None:
+            return (time.perf_counter() - started) * 1000
+        return None
+
+    def baseline_ping(self, count=20):
+        """空闲时的 ping 延迟，作为事件循环阻塞判断的基准"""
+        histogram = Histogram()
+        for _ in range(count):
+            latency_ms = self.ping_once()
+            if latency_ms is not None:
+                histogram.record(latency_ms)
+            time.sleep(self.probe_interval / 4)
+        return histogram.summary()
+
+    def _probe(self, stop):
+        while not stop.wait(self.probe_interval):
+            latency_ms = self.ping_once()
+            if latency_ms is not None:
+                self.ping.record(latency_ms)
+                self.window.ping.record(latency_ms)
+
+    def _sample(self, stop, stage_index, run_started, live):
+        self.sampler.sample()
+        while not stop.wait(self.sample_interval):
+            with self._lock:
+                window, self.window = self.window, Window()
+            point = {
+                "t": round(time.perf_counter() - run_started, 1),
+                "stage": stage_index,
+                "throughput": round(window.completed / self.sample_interval, 1),
+                "errors": window.errors,
+                "p50_ms": window.latency.percentile(50) if window.latency.count else None,
+                "p99_ms": window.latency.percentile(99) if window.latency.count else None,
+                "ping_p99_ms": window.ping.percentile(99) if window.ping.count else None,
+                **(self.sampler.sample() or {}),
+            }
+            self.timeline.append(point)
+            if live:
+                print(format_point(point), flush=True)
+
+    def _run_concurrency(self, concurrency, deadline):
+        def worker():
+            while time.perf_counter() < deadline:
+                self.call_once()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _run_rate(self, rate, deadline):
+        interval = 1 / rate
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            scheduled = time.perf_counter()
+            while scheduled < deadline:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.call_once, scheduled)
+                scheduled += interval
+
+    def run_stage(self, stage_index, stage, run_started, live):
+        self._reset_stage()
+        mode = stage["mode"]
+        duration = stage.get("duration") or 10
+        stop = threading.Event()
+        background = [
+            threading.Thread(target=self._probe, args=(stop,), daemon=True),
+            threading.Thread(target=self._sample, args=(stop, stage_index, run_started, live), daemon=True),
+        ]
+        for thread in background:
+            thread.start()
+        started = time.perf_counter()
+        deadline = started + duration
+        if mode == "rate":
+            self._run_rate(stage.get("rate") or 100, deadline)
+        elif mode == "concurrency":
+            self._run_concurrency(stage.get("concurrency") or 8, deadline)
+        else:
+            raise ValueError(f"未知的负载模式: {mode}")
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in background:
+            thread.join()
+
+        completed = self.ok + sum(self.errors.values())
+        points = [p for p in self.timeline if p["stage"] == stage_index]
+        rss = [p["rss_mb"] for p in points if p.get("rss_mb") is not None]
+        cpu = [p["cpu_pct"] for p in points if p.get("cpu_pct") is not None]
+        return {
+            "mode": mode,
+            "target": stage.get("rate") if mode == "rate" else stage.get("concurrency"),
+            "duration_s": round(elapsed, 2),
+            "completed": completed,
+            "ok": self.ok,
+            "errors": dict(self.errors),
+            "error_rate": round(sum(self.errors.values()) / completed, 4) if completed else 0.0,
+            "throughput": round(completed / elapsed, 1),
+            "latency": self.latency.summary(),
+            "ping": self.ping.summary(),
+            "peak_rss_mb": max(rss) if rss else None,
+            "avg_cpu_pct": round(sum(cpu) / len(cpu), 1) if cpu else None,
+        }
+
+
+def _show(value, width):
+    """数值保留一位小数右对齐，缺失时显示 -"""
+    return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+
+def format_point(point):
+    return (f"  t={point['t']:>6}s  {point['throughput']:>8.1f} req/s  err {point['errors']:>4}"
+            f"  p50 {_show(point['p50_ms'], 8)} ms  p99 {_show(point['p99_ms'], 8)} ms"
+            f"  ping p99 {_show(point['ping_p99_ms'], 7)} ms"
+            f"  rss {_show(point.get('rss_mb'), 6)} MB  cpu {_show(point.get('cpu_pct'), 5)}%")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_http_server(script, transport, port, timeout=30):
+    """以 HTTP 传输启动服务器子进程，等待端口可连接"""
+    env = {**os.environ, "MCP_TRANSPORT": transport, "MCP_PORT": str(port), "MCP_HOST": "127.0.0.1"}
+    process = subprocess.Popen(
+        [sys.executable, script], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器启动失败，退出码 {process.returncode}")
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return process
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("等待服务器端口超时")
+
+
+def connect(scenario, max_in_flight):
+    """连接被测服务器，返回 (客户端, 服务器进程 PID, 清理函数)"""
+    from mcp_client import MCPHttpClient, MCPStdioClient
+
+    script = SERVERS[scenario["server"]]
+    transport = scenario["transport"]
+    if transport == "stdio":
+        # 不自动重启：压测中服务器崩溃应当体现为错误
+        mcp_client = MCPStdioClient(script, cwd=ROOT, max_in_flight=max_in_flight, supervise=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not mcp_client.start_server() or not mcp_client.initialize():
+                raise RuntimeError("服务器启动失败")
+            mcp_client.list_tools()
+        return mcp_client, mcp_client.process.pid, mcp_client.stop_server
+
+    port = free_port()
+    process = start_http_server(script, transport, port)
+    path = "/sse" if transport == "sse" else "/mcp/"
+    mcp_client = MCPHttpClient(f"http://127.0.0.1:{port}{path}", transport=transport, pool_size=max_in_flight)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not mcp_client.start_server() or not mcp_client.initialize():
+            process.kill()
+            raise RuntimeError("连接服务器失败")
+        mcp_client.list_tools()
+
+    def close():
+        mcp_client.stop_server()
+        process.terminate()
+        process.wait()
+    return mcp_client, process.pid, close
+
+
+def run(scenario, live=True):
+    for key, value in scenario["env"].items():
+        os.environ[key] = str(value)
+    services = start_fake_services(
+        bgm_latency_ms=scenario["upstream_latency_ms"],
+        ec2_latency_ms=scenario["upstream_latency_ms"],
+    )
+    max_in_flight = max(64, max(
+        (stage.get("concurrency") or 0) if stage["mode"] == "concurrency" else scenario["max_workers"]
+        for stage in scenario["stages"]
+    ) + 8)
+    try:
+        mcp_client, pid, close = connect(scenario, max_in_flight)
+        try:
+            load = LoadRun(mcp_client, scenario, ProcSampler(pid))
+            idle_ping = load.baseline_ping()
+            run_started = time.perf_counter()
+            stages = []
+            for index, stage in enumerate(scenario["stages"]):
+                if live:
+                    target = f"{stage.get('rate')} req/s" if stage["mode"] == "rate" else f"{stage.get('concurrency')} 并发"
+                    print(f"▶️  阶段 {index + 1}/{len(scenario['stages'])}: {stage['mode']} {target}，{stage.get('duration') or 10}s")
+                stages.append(load.run_stage(index, stage, run_started, live))
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                close()
+    finally:
+        services.stop()
+    return {
+        "scenario": scenario,
+        "idle_ping": idle_ping,
+        "stages": stages,
+        "timeline": load.timeline,
+    }
+
+
+def print_summary(result):
+    idle_p99 = result["idle_ping"].get("p99_ms")
+    print(f"\n空闲 ping: p50 {result['idle_ping'].get('p50_ms')} ms，p99 {idle_p99} ms")
+    print(f"{'stage':<18}{'req/s':>9}{'ok':>8}{'err%':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'ping p99':>10}{'rss MB':>8}{'cpu%':>7}")
+    for index, stage in enumerate(result["stages"]):
+        latency, ping = stage["latency"], stage["ping"]
+        name = f"{index + 1}:{stage['mode']}={stage['target']}"
+        print(f"{name:<18}{stage['throughput']:>9.1f}{stage['ok']:>8}{stage['error_rate']:>7.1%}"
+              f"{_show(latency['p50_ms'], 9)}{_show(latency['p99_ms'], 9)}{_show(latency['max_ms'], 9)}"
+              f"{_show(ping['p99_ms'], 10)}{_show(stage['peak_rss_mb'], 8)}{_show(stage['avg_cpu_pct'], 7)}")
+        if stage["errors"]:
+            print(f"{'':<18}错误: {stage['errors']}")
+        # 负载下 ping 明显变慢：事件循环被同步调用阻塞
+        if idle_p99 and ping["p99_ms"] and ping["p99_ms"] > max(10 * idle_p99, idle_p99 + 20):
+            print(f"{'':<18}⚠️ ping p99 为空闲时的 {ping['p99_ms'] / idle_p99:.0f} 倍，事件循环可能被同步调用阻塞")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP 服务器负载生成器")
+    parser.add_argument("--scenario", help="场景文件（JSON）")
+    parser.add_argument("--server", choices=sorted(SERVERS), help="被测服务器")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http", "sse"], help="传输方式")
+    parser.add_argument("--tool", help="调用的工具（默认 anime: get_anime_calendar，ec2: get_ec2_instance_status）")
+    parser.add_argument("--arguments", help="工具参数（JSON）")
+    parser.add_argument("--mode", choices=["rate", "concurrency"], help="负载模式，指定时覆盖场景中的阶段")
+    parser.add_argument("--rate", type=float, default=100, help="rate 模式的目标请求数/秒")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrency 模式的并发数")
+    parser.add_argument("--duration", type=float, default=10, help="阶段持续秒数")
+    parser.add_argument("--upstream-latency-ms", dest="upstream_latency_ms", type=float, help="替身 bgm.tv / EC2 的响应延迟")
+    parser.add_argument("--timeout", type=float, help="单个请求的超时秒数")
+    parser.add_argument("--probe-interval-ms", dest="probe_interval_ms", type=float, help="事件循环探针的 ping 间隔")
+    parser.add_argument("--sample-interval", dest="sample_interval", type=float, help="时间序列的采样间隔（秒）")
+    parser.add_argument("--max-workers", dest="max_workers", type=int, help="rate 模式的最大同时请求数")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args()
+
+    configure_logging(level="ERROR")
+    scenario = load_scenario(args)
+    result = run(scenario, live=not args.json)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print_summary(result)
+    if args.output:
+        print(f"✅ 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
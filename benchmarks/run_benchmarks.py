@@ -0,0 +1,279 @@
+"""离线端到端基准测试
+
+不需要真实的 API Key 和网络：Anthropic Messages 流式接口、api.bgm.tv 和 EC2
+都由 benchmarks/fakes.py 中的本地替身提供。测量内容：
+
+- startup: MCPToolRouter 并行启动 anime + ec2 服务器（启动、initialize、tools/list）
+- tool_round_trip: 经由 stdio 的单次工具调用往返
+- turn_stages: query_with_mcp_tools 单轮对话按阶段拆分（客户端 span 直方图）
+- server_stages: 服务器端工具执行与上游调用（由 MCP_TRACE_FILE 汇总）
+- throughput: MCPStdioClient 通过回显服务器的 messages/sec 与 MB/s
+
+用法:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --compare results.json
+    python benchmarks/run_benchmarks.py --model-routes '{"stream": {"model": "claude-3-5-haiku-20241022", "max_tokens": 512}}'
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import start_fake_services
+from mcp_logging import configure_logging
+from mcp_routing import STAGES
+from mcp_tracing import Histogram, configure_tracing
+
+TEST_QUERIES = [
+    "请帮我查询这周的动漫播放安排，我想看看星期五有什么好看的番剧。",
+    "今天有什么动漫播出？",
+    "帮我查看星期一的番剧安排",
+]
+
+TOOL_CALLS = {
+    "anime__get_anime_calendar": {"weekday": 5, "format": "detailed"},
+    "ec2__get_ec2_instance_status": {},
+}
+
+# 写入 MCP_TRACE_FILE 的服务器进程（客户端 span 已由进程内直方图统计）
+SERVER_SERVICES = ("mcp_server", "aws_mcp_server")
+
+# 越大越好的指标，其余均为延迟（越小越好）
+HIGHER_IS_BETTER = ("messages_per_sec", "mb_per_sec")
+
+
+def quiet(enabled):
+    """屏蔽 mcp_client 的控制台输出，避免终端渲染计入耗时"""
+    return contextlib.redirect_stdout(io.StringIO()) if enabled else contextlib.nullcontext()
+
+
+def make_router():
+    from mcp_client import MCPStdioClient, MCPToolRouter
+
+    # 关闭客户端工具缓存，测量的是真实的 stdio 往返
+    return MCPToolRouter({
+        "anime": MCPStdioClient("mcp_server.py", cwd=ROOT),
+        "ec2": MCPStdioClient("aws_mcp_server.py", cwd=ROOT),
+    }, cache=False)
+
+
+def bench_startup(runs, is_quiet):
+    histogram = Histogram()
+    servers = []
+    for _ in range(runs):
+        router = make_router()
+        start = time.perf_counter()
+        with quiet(is_quiet):
+            router.start_server()
+        histogram.record((time.perf_counter() - start) * 1000)
+        servers = list(router.clients)
+        with quiet(is_quiet):
+            router.stop_server()
+    return {**histogram.summary(), "servers": servers}
+
+
+def bench_tool_calls(router, count, is_quiet):
+    results = {}
+    for tool_name, arguments in TOOL_CALLS.items():
+        if tool_name not in router.dispatch:
+            results[tool_name] = {"skipped": "服务器不可用"}
+            continue
+        histogram = Histogram()
+        errors = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            with quiet(is_quiet):
+                result = router.call_tool(tool_name, arguments)
+            histogram.record((time.perf_counter() - start) * 1000)
+            if not result or result.get("isError"):
+                errors += 1
+        results[tool_name] = {**histogram.summary(), "errors": errors}
+    return results
+
+
+def bench_turns(router, turns, is_quiet, prefetch=False):
+    from mcp_client import SpeculativePrefetcher, query_with_mcp_tools
+
+    tracer = configure_tracing("benchmark")
+    prefetcher = SpeculativePrefetcher(router) if prefetch else None
+    failures = 0
+    for i in range(turns):
+        with quiet(is_quiet):
+            success, _ = query_with_mcp_tools(TEST_QUERIES[i % len(TEST_QUERIES)], router, prefetcher=prefetcher)
+        if success is None:
+            failures += 1
+    result = {**tracer.report(), "failures": failures}
+    if prefetcher:
+        prefetcher.close()
+        result["prefetch"] = prefetcher.report()
+    return result
+
+
+def collect_server_stages(trace_file):
+    """汇总服务器子进程写入的 span"""
+    histograms = {}
+    if not os.path.exists(trace_file):
+        return {}
+    with open(trace_file, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            if span["service"] not in SERVER_SERVICES:
+                continue
+            key = f"{span['service']}:{span['name']}"
+            histograms.setdefault(key, Histogram()).record(span["duration_ms"])
+    return {name: h.summary() for name, h in sorted(histograms.items())}
+
+
+def bench_throughput(count):
+    from bench_stdio_throughput import run_case
+    from mcp_codec import get_codec
+
+    codec_name = get_codec().name
+    return [run_case(codec_name, size, max(20, count * 1024 // size)) for size in (1024, 256 * 1024)]
+
+
+def model_routes():
+    """本次测量使用的各阶段模型配置"""
+    from mcp_client import model_routing
+
+    return {stage: model_routing.route(stage) for stage in STAGES}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results):
+    """把结果展开成 {指标路径: 数值}，用于跨提交对比"""
+    metrics = {}
+    metrics["startup.p50_ms"] = results["startup"].get("p50_ms")
+    for tool, summary in results["tool_round_trip"].items():
+        for key in ("p50_ms", "p99_ms"):
+            metrics[f"tool_round_trip.{tool}.{key}"] = summary.get(key)
+    for section in ("turn_stages", "server_stages"):
+        for stage, summary in results[section].items():
+            if isinstance(summary, dict):
+                for key in ("p50_ms", "p99_ms"):
+                    metrics[f"{section}.{stage}.{key}"] = summary.get(key)
+    for case in results["throughput"]:
+        for key in HIGHER_IS_BETTER:
+            metrics[f"throughput.{case['payload_bytes']}B.{key}"] = case[key]
+    return {k: v for k, v in metrics.items() if v is not None}
+
+
+def compare(baseline, current, threshold):
+    """打印与基线的差异，返回回退的指标列表"""
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    print(f"\n📈 与基线 {baseline['meta'].get('commit')} 对比（阈值 {threshold:.0%}）")
+    print(f"{'metric':<64}{'baseline':>12}{'current':>12}{'delta':>9}")
+    for name in sorted(set(old) & set(new)):
+        if not old[name]:
+            continue
+        delta = (new[name] - old[name]) / old[name]
+        worse = -delta if name.endswith(HIGHER_IS_BETTER) else delta
+        flag = " ❌" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<64}{old[name]:>12.2f}{new[name]:>12.2f}{delta:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线端到端基准测试")
+    parser.add_argument("--startups", type=int, default=3, help="客户端启动测量次数")
+    parser.add_argument("--tool-calls", type=int, default=100, help="每个工具的调用次数")
+    parser.add_argument("--turns", type=int, default=20, help="完整对话轮次数")
+    parser.add_argument("--messages", type=int, default=500, help="吞吐量测试的基准消息数")
+    parser.add_argument("--ttft-ms", type=float, default=0, help="替身模型的首 token 延迟")
+    parser.add_argument("--event-interval-ms", type=float, default=0, help="替身模型的事件间隔")
+    parser.add_argument("--upstream-latency-ms", type=float, default=0, help="替身 bgm.tv / EC2 的响应延迟")
+    parser.add_argument("--model-routes", help="各阶段的模型路由（JSON 字符串或文件，同 MCP_MODEL_ROUTES）")
+    parser.add_argument("--prefetch", action="store_true", help="单轮对话测试开启推测性工具预取")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="用于对比的基线结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定回退的相对变化阈值")
+    parser.add_argument("--verbose", action="store_true", help="保留客户端控制台输出")
+    args = parser.parse_args()
+
+    configure_logging(level="WARNING")
+    if args.model_routes:
+        os.environ["MCP_MODEL_ROUTES"] = args.model_routes
+    services = start_fake_services(
+        ttft_ms=args.ttft_ms,
+        event_interval_ms=args.event_interval_ms,
+        bgm_latency_ms=args.upstream_latency_ms,
+        ec2_latency_ms=args.upstream_latency_ms,
+    )
+    trace_file = os.path.join(tempfile.mkdtemp(prefix="mcp-bench-"), "spans.jsonl")
+    os.environ["MCP_TRACE_FILE"] = trace_file
+    is_quiet = not args.verbose
+
+    try:
+        print("⏱️  测量客户端启动...")
+        startup = bench_startup(args.startups, is_quiet)
+
+        router = make_router()
+        with quiet(is_quiet):
+            router.start_server()
+        try:
+            print("⏱️  测量工具调用往返...")
+            tool_round_trip = bench_tool_calls(router, args.tool_calls, is_quiet)
+            print("⏱️  测量单轮对话各阶段耗时...")
+            turn_stages = bench_turns(router, args.turns, is_quiet, args.prefetch)
+        finally:
+            with quiet(is_quiet):
+                router.stop_server()
+
+        print("⏱️  测量 stdio 吞吐量...")
+        with quiet(is_quiet):
+            throughput = bench_throughput(args.messages)
+    finally:
+        services.stop()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "model_routes": model_routes(),
+        },
+        "startup": startup,
+        "tool_round_trip": tool_round_trip,
+        "turn_stages": turn_stages,
+        "server_stages": collect_server_stages(trace_file),
+        "throughput": throughput,
+    }
+
+    print(json.dumps(flatten(results), ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 项性能回退")
+            sys.exit(1)
+        print("\n✅ 未发现性能回退")
+
+
+if __name__ == "__main__":
+    main()
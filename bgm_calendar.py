@@ -1,10 +1,25 @@
+import hashlib
+import os
+import threading
+import time
 import requests
 from typing import Dict, Any, Optional, List
 import json
+from mcp_tracing import get_tracer
+from mcp_metrics import cache_hits, cache_misses, timed_upstream
 
 class AnimeCalendarTool:
     def __init__(self):
-        self.api_url = "https://api.bgm.tv/calendar"
+        # 可通过 BGM_API_URL 指向本地替身服务（基准测试用）
+        self.api_url = os.environ.get("BGM_API_URL", "https://api.bgm.tv/calendar")
+        # 放送日历一天内基本不变，短时间缓存避免每次调用都请求上游
+        self.cache_ttl = float(os.environ.get("BGM_CACHE_TTL", "300"))
+        self._cache = None  # (过期时间, 数据)
+        # 每天内容的哈希，用于判断上游数据是否真的变化；工具调用和资源读取会在多个
+        # 工作线程中同时获取日历，读写哈希和变化集合时需要持有 _hash_lock
+        self._day_hashes = {}
+        self._changed_weekdays = set()
+        self._hash_lock = threading.Lock()
         self.weekdays = {
             1: "星期一",
             2: "星期二", 
@@ -21,13 +36,7 @@ class AnimeCalendarTool:
         """
         try:
             # 获取API数据
-            response = requests.get(
-                self.api_url,
-                headers={'accept': 'application/json'},
-                timeout=10
-            )
-            response.raise_for_status()
-            calendar_data = response.json()
+            calendar_data = self._fetch_calendar()
             
             if weekday:
                 # 返回指定星期的番剧
@@ -41,6 +50,56 @@ class AnimeCalendarTool:
         except Exception as e:
             return f"❌ 处理数据时出错: {str(e)}"
     
+    def get_calendar(self) -> List[Dict]:
+        """获取放送日历原始数据（带缓存）"""
+        return self._fetch_calendar()
+    
+    def refresh(self) -> set:
+        """绕过缓存重新获取日历，返回自上次调用以来内容发生变化的星期（1-7）"""
+        self._fetch_calendar(force=True)
+        with self._hash_lock:
+            changed, self._changed_weekdays = self._changed_weekdays, set()
+        return changed
+    
+    def _update_hashes(self, calendar_data: List[Dict]):
+        """按天计算内容哈希，记录变化的星期；首次获取不算变化"""
+        hashes = {
+            day["weekday"]["id"]: hashlib.sha256(
+                json.dumps(day, sort_keys=True, ensure_ascii=False).encode("utf-8")
+            ).hexdigest()
+            for day in calendar_data
+        }
+        with self._hash_lock:
+            if self._day_hashes:
+                self._changed_weekdays |= {
+                    weekday for weekday in hashes.keys() | self._day_hashes.keys()
+                    if hashes.get(weekday) != self._day_hashes.get(weekday)
+                }
+            self._day_hashes = hashes
+    
+    def _fetch_calendar(self, force: bool = False) -> List[Dict]:
+        """获取放送日历，在 cache_ttl 秒内复用上一次的结果"""
+        now = time.monotonic()
+        if not force and self._cache and self._cache[0] > now:
+            cache_hits.inc(cache="bgm_calendar")
+            return self._cache[1]
+        cache_misses.inc(cache="bgm_calendar")
+
+        with get_tracer().start_span("bgm.fetch", {"http.url": self.api_url}) as span, \
+                timed_upstream("bgm", "calendar"):
+            response = requests.get(
+                self.api_url,
+                headers={'accept': 'application/json'},
+                timeout=10
+            )
+            span.set_attribute("http.status_code", response.status_code)
+            response.raise_for_status()
+        calendar_data = response.json()
+        self._update_hashes(calendar_data)
+        if self.cache_ttl > 0:
+            self._cache = (now + self.cache_ttl, calendar_data)
+        return calendar_data
+    
     def _format_single_day(self, data: List[Dict], weekday: int, format: str) -> str:
         """格式化单日番剧信息"""
         target_day = None
@@ -88,32 +147,37 @@ class AnimeCalendarTool:
     def _format_full_week(self, data: List[Dict], format: str) -> str:
         """格式化全周番剧信息"""
         result = "📺 本周番剧放送时间表\n\n"
-        
         for day in data:
-            weekday_name = day["weekday"]["cn"]
-            items = day["items"]
-            
-            if format == "simple":
-                result += f"📅 {weekday_name}: {len(items)}部\n"
-                # 显示当天评分最高的前3部
-                sorted_items = sorted(
-                    items, 
-                    key=lambda x: x.get("rating", {}).get("score", 0), 
-                    reverse=True
-                )
-                for item in sorted_items[:3]:
-                    name = item.get("name_cn") or item.get("name", "无标题")
-                    score = item.get("rating", {}).get("score", "暂无")
-                    result += f"  • {name} ({score})\n"
-                result += "\n"
-            else:
-                result += f"📅 {weekday_name} ({len(items)}部)\n"
-                for item in items[:5]:  # 每天最多显示5部
-                    name = item.get("name_cn") or item.get("name", "无标题")
-                    score = item.get("rating", {}).get("score", "暂无")
-                    result += f"  • {name} (评分: {score})\n"
-                if len(items) > 5:
-                    result += f"  ... 还有{len(items) - 5}部\n"
-                result += "\n"
+            result += self._format_week_day(day, format)
+        return result
+    
+    def _format_week_day(self, day: Dict, format: str) -> str:
+        """格式化全周视图中的一天"""
+        weekday_name = day["weekday"]["cn"]
+        items = day["items"]
+        result = ""
+        
+        if format == "simple":
+            result += f"📅 {weekday_name}: {len(items)}部\n"
+            # 显示当天评分最高的前3部
+            sorted_items = sorted(
+                items, 
+                key=lambda x: x.get("rating", {}).get("score", 0), 
+                reverse=True
+            )
+            for item in sorted_items[:3]:
+                name = item.get("name_cn") or item.get("name", "无标题")
+                score = item.get("rating", {}).get("score", "暂无")
+                result += f"  • {name} ({score})\n"
+            result += "\n"
+        else:
+            result += f"📅 {weekday_name} ({len(items)}部)\n"
+            for item in items[:5]:  # 每天最多显示5部
+                name = item.get("name_cn") or item.get("name", "无标题")
+                score = item.get("rating", {}).get("score", "暂无")
+                result += f"  • {name} (评分: {score})\n"
+            if len(items) > 5:
+                result += f"  ... 还有{len(items) - 5}部\n"
+            result += "\n"
         
         return result
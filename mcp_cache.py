@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 只读且幂等、但服务器没有声明 cacheTtlSeconds 的工具默认缓存秒数
+DEFAULT_TTL = float(os.environ.get("MCP_TOOL_CACHE_TTL", "60"))
+
+
+def canonical_arguments(arguments):
+    """参数规范化：键排序、紧凑分隔符，使等价的参数得到相同的缓存键"""
+    return json.dumps(arguments or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def cache_ttl(tool, default_ttl=DEFAULT_TTL):
+    """根据服务器声明的工具注解计算缓存时间，返回 0 表示不缓存
+
+    - 没有 readOnlyHint=true 或带 destructiveHint=true 的工具（启动/停止实例等有副作用的操作）不缓存；
+    - 服务器在注解中声明了 cacheTtlSeconds 时以其为准（0 表示结果随时在变，不缓存）；
+    - 否则只读且 idempotentHint=true 的工具使用 default_ttl。
+    """
+    annotations = tool.get("annotations") or {}
+    if not annotations.get("readOnlyHint") or annotations.get("destructiveHint"):
+        return 0
+    if annotations.get("cacheTtlSeconds") is not None:
+        return max(0.0, float(annotations["cacheTtlSeconds"]))
+    return default_ttl if annotations.get("idempotentHint") else 0
+
+
+class ToolResultCache:
+    """客户端工具结果缓存，键为 (服务器, 工具, 规范化参数)，按 LRU 淘汰"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.stats = {}  # 工具名 -> {"hits": n, "misses": n}
+        self._lock = threading.Lock()
+
+    def get(self, server, tool, arguments):
+        key = (server, tool, canonical_arguments(arguments))
+        now = time.monotonic()
+        with self._lock:
+            stats = self.stats.setdefault(f"{server}/{tool}", {"hits": 0, "misses": 0})
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                stats["hits"] += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            stats["misses"] += 1
+            return None
+
+    def put(self, server, tool, arguments, result, ttl):
+        key = (server, tool, canonical_arguments(arguments))
+        with self._lock:
+            self.entries[key] = (time.monotonic() + ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, server=None):
+        """清除某个服务器（或全部）的缓存，例如工具列表变化后"""
+        with self._lock:
+            for key in [key for key in self.entries if server is None or key[0] == server]:
+                del self.entries[key]
+
+    def report(self):
+        """各工具的命中次数和命中率"""
+        with self._lock:
+            return {
+                tool: {**stats, "hit_rate": round(stats["hits"] / (stats["hits"] + stats["misses"]), 3)}
+                for tool, stats in sorted(self.stats.items())
+                if stats["hits"] + stats["misses"]
+            }
+
+    def print_report(self):
+        report = self.report()
+        if not report:
+            print("（暂无可缓存的工具调用）")
+            return
+        print(f"{'tool':<40}{'hits':>7}{'misses':>8}{'hit rate':>10}")
+        for tool, s in report.items():
+            print(f"{tool:<40}{s['hits']:>7}{s['misses']:>8}{s['hit_rate']:>10.1%}")
+
+
+class ResourceMirror:
+    """订阅资源的本地镜像
+
+    第一次读取某个资源时先订阅再读取，之后直接返回本地副本；收到
+    notifications/resources/updated 时只把对应条目标记为失效，下一次读取时
+    才重新获取。服务器只在内容真正变化时发送通知，因此内容不变期间不会重复读取。
+    """
+
+    def __init__(self, client, on_update=None):
+        self.client = client
+        self.on_update = on_update
+        self.entries = {}  # uri -> contents
+        self.versions = {}  # uri -> 收到的更新通知次数
+        self.subscribed = set()
+        self.stats = {"hits": 0, "fetches": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+        client.on_notification("notifications/resources/updated", self._on_updated)
+
+    def _on_updated(self, params):
+        uri = params.get("uri")
+        with self._lock:
+            self.versions[uri] = self.versions.get(uri, 0) + 1
+            if self.entries.pop(uri, None) is not None:
+                self.stats["invalidations"] += 1
+        if self.on_update:
+            self.on_update(uri)
+
+    def get(self, uri):
+        """读取资源内容（contents 列表），镜像有效时不访问服务器"""
+        with self._lock:
+            contents = self.entries.get(uri)
+            if contents is not None:
+                self.stats["hits"] += 1
+                return contents
+            version = self.versions.get(uri, 0)
+        # 先订阅再读取，读取期间发生的变化也能收到通知
+        if uri not in self.subscribed and self.client.subscribe_resource(uri):
+            self.subscribed.add(uri)
+        contents = self.client.read_resource(uri)
+        if contents is None:
+            return None
+        with self._lock:
+            self.stats["fetches"] += 1
+            # 只有订阅成功、且读取期间没有收到更新通知时才保存副本
+            if uri in self.subscribed and self.versions.get(uri, 0) == version:
+                self.entries[uri] = contents
+        return contents
+
+    def print_report(self):
+        stats = self.stats
+        reads = stats["hits"] + stats["fetches"]
+        hit_rate = stats["hits"] / reads if reads else 0
+        print(f"已镜像 {len(self.entries)} / 已订阅 {len(self.subscribed)} 个资源，"
+              f"命中 {stats['hits']}，读取 {stats['fetches']}，失效 {stats['invalidations']}，命中率 {hit_rate:.1%}")
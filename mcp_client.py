@@ -1,162 +1,541 @@
 import os
 import subprocess
 import json
+import contextvars
+import logging
+import sys
 import threading
 import queue
+import re
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, timedelta
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
 from rich import print
+from rich.markup import escape
 from dotenv import load_dotenv
 import anthropic
 from prompt_toolkit import prompt
+from mcp_cache import ResourceMirror, ToolResultCache, cache_ttl, canonical_arguments
+from mcp_codec import get_codec
+from mcp_logging import PayloadSampler, configure_logging, elapsed_ms, get_logger, parse_log_record
+from mcp_routing import ModelRoutingPolicy
+from mcp_schema import SchemaValidators
+from mcp_store import DEFAULT_WINDOW as HISTORY_WINDOW, ConversationStore, trim_window
+from mcp_tracing import configure_tracing, get_tracer, inject_meta
 
 load_dotenv()
 
+logger = get_logger("mcp_client")
+# 完整请求/响应内容单独使用一个记录器，默认级别下不输出
+payload_logger = get_logger("mcp_client.payload")
+
+# 服务器 stderr 日志级别 -> 客户端日志级别（服务器 INFO 每次请求都会出现，降为 DEBUG）
+SERVER_LOG_LEVELS = {
+    "CRITICAL": logging.ERROR,
+    "ERROR": logging.ERROR,
+    "WARNING": logging.WARNING,
+    "INFO": logging.DEBUG,
+    "DEBUG": logging.DEBUG,
+}
+
 api_key = os.environ.get("ANTHROPIC_API_KEY")
 print(f"API Key loaded: {api_key[:10]}..." if api_key else "No API Key found")
 
 # 初始化 Anthropic 客户端
 client = anthropic.Anthropic(api_key=api_key)
+# 各阶段使用的模型和 max_tokens（MCP_MODEL_ROUTES）
+model_routing = ModelRoutingPolicy.from_env()
+
+# 本地 MCP 服务器：名称用作工具命名空间
+MCP_SERVERS = {
+    "anime": "mcp_server.py",
+    "ec2": "aws_mcp_server.py",
+}
+
+
+default_payload_sampler = PayloadSampler()
+
+
+def log_payload(sampler, label, payload):
+    """按采样率记录完整负载，日志关闭时不做任何格式化"""
+    if payload_logger.isEnabledFor(logging.DEBUG) and sampler.should_log():
+        payload_logger.debug("%s %s", label, sampler.render(payload))
+
+
+def with_progress_token(params, token):
+    """在 params._meta 中加入 progressToken（返回新字典）"""
+    params = dict(params or {})
+    params["_meta"] = {**params.get("_meta", {}), "progressToken": token}
+    return params
+
+
+def notify_progress(on_progress, notification):
+    """回调进度处理函数，回调出错不影响请求本身"""
+    try:
+        on_progress(notification.get("params", {}))
+    except Exception:
+        logger.exception("处理进度通知失败")
+
+# 服务器进程退出时投递给等待者的内部消息
+SERVER_EXITED = "$/server_exited"
+
+# 可以在服务器重启后原样重放的请求；tools/call 另外按工具注解判断
+IDEMPOTENT_METHODS = {
+    "ping", "tools/list", "resources/list", "resources/templates/list", "resources/read",
+    "resources/subscribe", "resources/unsubscribe", "prompts/list", "prompts/get",
+}
+
 
 class MCPStdioClient:
-    """本地 STDIO MCP 客户端"""
+    """本地 STDIO MCP 客户端
+
+    内存上限与背压策略：
+    - 每个请求有自己的等待队列（pending），读取线程按 ID 直接投递，从不阻塞，
+      因此服务器的 stdout 管道总能被及时读空；
+    - 没有等待者的响应（通常是已超时请求的迟到响应）放入 orphans，超过
+      orphan_ttl 秒或超过 max_orphans 条时按时间先后淘汰（每次投递响应时检查）；
+    - 服务器发来的请求不会进入 orphans：ping 直接回复，其余回复 -32601；
+    - 服务器 stderr 中的错误行只保留最近 stderr_buffer_size 条（环形缓冲）；
+    - 同时进行中的请求最多 max_in_flight 个，超出时调用方阻塞等待空位，
+      在超时时间内拿不到空位则直接返回 None，不再向服务器 stdin 写入。
+
+    进程监督（supervise=True）：
+    - 通过 stdout EOF 和进程退出立即发现服务器退出，进行中的请求马上得到通知，
+      不再各自等满超时；
+    - 自动重启服务器并重新握手，工具列表沿用缓存，不再请求 tools/list；
+      重新订阅之前订阅的资源，并在本地发出资源更新通知让镜像失效；
+    - 幂等的请求（IDEMPOTENT_METHODS，以及注解为只读或幂等的工具调用）在新进程上
+      原样重放，其余请求直接返回错误；
+    - restart_window 秒内重启超过 max_restarts 次视为崩溃循环，不再重启；
+    - 重启次数、重放次数和恢复耗时（mcp.recovery 直方图）见 debug_info()。
+    """
     
-    def __init__(self, server_script_path, cwd=None):
+    def __init__(self, server_script_path, cwd=None, codec=None, payload_sampler=None,
+                 max_in_flight=32, stderr_buffer_size=200, max_orphans=100, orphan_ttl=60,
+                 supervise=True, max_restarts=5, restart_window=60):
         self.server_script_path = server_script_path
         self.cwd = cwd or os.getcwd()
+        self.codec = get_codec(codec)
+        self.payload_sampler = payload_sampler or PayloadSampler()
         self.process = None
         self.tools = []
-        self.response_queue = queue.Queue()
-        self.stderr_queue = queue.Queue()
+        self.server_capabilities = {}
         self.request_id = 0
+        self.notification_handlers = {}
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.orphans = OrderedDict()
+        self.max_orphans = max_orphans
+        self.orphan_ttl = orphan_ttl
+        self.orphans_evicted = 0
+        self.stderr_buffer = deque(maxlen=stderr_buffer_size)
+        self.stderr_dropped = 0
+        self.max_in_flight = max_in_flight
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.write_lock = threading.Lock()
+        self.subscriptions = set()
+        # 进程监督状态
+        self.supervise = supervise
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.supervise_lock = threading.Lock()
+        self.ready = threading.Event()  # 服务器可以接收请求（重启期间清除）
+        self.generation = 0  # 每启动一次服务器进程加一
+        self.exited_generation = 0
+        self.restarting = False
+        self.stopping = False
+        self.failed = False
+        self.restart_times = deque()
+        self.restarts = 0
+        self.replayed = 0
+        self.last_recovery_ms = None
+    
+    def on_notification(self, method, handler):
+        """注册服务器通知回调（在读取线程中执行，回调内不要发送请求）"""
+        self.notification_handlers.setdefault(method, []).append(handler)
+    
+    def _dispatch_notification(self, message):
+        for handler in self.notification_handlers.get(message["method"], []):
+            try:
+                handler(message.get("params", {}))
+            except Exception:
+                logger.exception("处理通知 %s 失败", message["method"])
     
     def start_server(self):
         """启动 MCP 服务器进程"""
+        self.stopping = False
+        self.failed = False
+        if not self._spawn():
+            return False
+        self.ready.set()
+        return True
+    
+    def _spawn(self):
+        """启动一个新的服务器进程及其读取线程"""
         try:
-            self.process = subprocess.Popen(
+            process = subprocess.Popen(
                 ["python", self.server_script_path],
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
                 cwd=self.cwd,
-                env=dict(os.environ),
-                bufsize=0  # 无缓冲
+                env=dict(os.environ)
             )
-            
-            # 启动后台线程读取输出
-            self._start_reader_threads()
-            
-            print(f"[green]✅ MCP 服务器已启动 (PID: {self.process.pid})[/green]")
-            return True
         except Exception as e:
             print(f"[red]❌ 启动 MCP 服务器失败: {e}[/red]")
             return False
+        with self.supervise_lock:
+            self.process = process
+            self.generation += 1
+        
+        # 启动后台线程读取输出
+        self._start_reader_threads(process)
+        
+        print(f"[green]✅ MCP 服务器已启动 (PID: {process.pid})[/green]")
+        return True
     
-    def _start_reader_threads(self):
-        """启动后台线程读取 stdout 和 stderr"""
+    def _start_reader_threads(self, process):
+        """启动后台线程读取 stdout 和 stderr，并监视进程退出"""
         def read_stdout():
-            while self.process and self.process.poll() is None:
+            # 以 bytes 读取整行，直接交给编解码器，不做 decode/strip 拷贝；读到 EOF 说明服务器已退出
+            for line in iter(process.stdout.readline, b""):
+                log_payload(self.payload_sampler, "📥 收到服务器响应:", line)
                 try:
-                    line = self.process.stdout.readline()
-                    if line:
-                        print(f"📥 收到服务器响应: {line.strip()}")
-                        try:
-                            response = json.loads(line.strip())
-                            self.response_queue.put(response)
-                        except json.JSONDecodeError as e:
-                            print(f"⚠️ JSON 解析错误: {e}, 原始数据: {line.strip()}")
-                except Exception as e:
-                    print(f"❌ 读取 stdout 错误: {e}")
-                    break
+                    response = self.codec.loads(line)
+                    if "method" in response and "id" not in response:
+                        if response["method"] == "notifications/progress":
+                            self._deliver_progress(response)
+                        self._dispatch_notification(response)
+                    elif "method" in response:
+                        self._answer_server_request(response, process)
+                    else:
+                        self._deliver(response)
+                except self.codec.DecodeError as e:
+                    logger.warning("JSON 解析错误: %s, 原始数据: %r", e, line[:200])
+                except Exception:
+                    logger.exception("读取 stdout 错误")
+            self._on_server_exit(process)
         
         def read_stderr():
-            while self.process and self.process.poll() is None:
+            for line in iter(process.stderr.readline, b""):
                 try:
-                    line = self.process.stderr.readline()
-                    if line:
-                        error_msg = line.strip()
-                        # 区分日志级别，只有真正的错误才标记为错误
-                        if any(level in error_msg.upper() for level in ['ERROR', 'CRITICAL', 'FATAL']):
-                            print(f"[red]🔴 MCP 服务器错误: {error_msg}[/red]")
-                            self.stderr_queue.put(error_msg)
-                        elif any(level in error_msg.upper() for level in ['WARN', 'WARNING']):
-                            print(f"[yellow]⚠️ MCP 服务器警告: {error_msg}[/yellow]")
-                        elif any(level in error_msg.upper() for level in ['INFO', 'DEBUG']):
-                            print(f"ℹ️ MCP 服务器信息: {error_msg}")
-                        else:
-                            # 对于无法识别级别的消息，保持谨慎，仍标记为错误
-                            print(f"[yellow]🔴 MCP 服务器输出: {error_msg}[/yellow]")
-                            self.stderr_queue.put(error_msg)
-                except Exception as e:
-                    print(f"[red]❌ 读取 stderr 错误: {e}[/red]")
-                    break
+                    error_msg = line.decode("utf-8", "replace").strip()
+                    # 按解析出的日志记录级别分类，只有真正的错误才标记为错误
+                    record = parse_log_record(error_msg)
+                    level = SERVER_LOG_LEVELS.get(record["level"])
+                    if level is None:
+                        # 对于无法识别级别的消息（如 traceback），保持谨慎，仍标记为错误
+                        logger.warning("MCP 服务器输出: %s", error_msg, extra={"server": self.server_script_path})
+                        self._buffer_stderr(error_msg)
+                    else:
+                        if logger.isEnabledFor(level):
+                            logger.log(level, "MCP 服务器 %s: %s", record["level"], record["msg"],
+                                       extra={"server": self.server_script_path})
+                        if level >= logging.ERROR:
+                            self._buffer_stderr(error_msg)
+                except Exception:
+                    logger.exception("读取 stderr 错误")
+        
+        def watch_process():
+            process.wait()
+            self._on_server_exit(process)
         
         # 启动后台线程
         threading.Thread(target=read_stdout, daemon=True).start()
         threading.Thread(target=read_stderr, daemon=True).start()
+        threading.Thread(target=watch_process, daemon=True).start()
+    
+    def _on_server_exit(self, process):
+        """服务器进程退出（stdout EOF、进程结束或写入失败）：通知所有等待者并安排重启"""
+        with self.supervise_lock:
+            if process is not self.process or self.stopping or self.exited_generation == self.generation:
+                return
+            self.exited_generation = generation = self.generation
+            self.ready.clear()
+            start_restart = self.supervise and not self.restarting
+            if start_restart:
+                self.restarting = True
+        returncode = self._kill(process)
+        logger.warning("💥 MCP 服务器已退出 (PID: %s, 退出码: %s)", process.pid, returncode)
+        if self.stderr_buffer:
+            logger.error("🔴 服务器错误输出: %s", list(self.stderr_buffer))
+        
+        exited = {"method": SERVER_EXITED, "params": {"generation": generation}}
+        with self.pending_lock:
+            waiters = list(self.pending.values())
+        for waiter in waiters:
+            waiter.put_nowait(exited)
+        
+        if start_restart:
+            threading.Thread(target=self._restart, daemon=True).start()
+        elif not self.supervise:
+            self.failed = True
+            self.ready.set()
+    
+    def _restart(self):
+        """重启服务器并重新握手，成功后放行等待中的请求"""
+        detected = time.perf_counter()
+        while True:
+            recovered = self._respawn()
+            with self.supervise_lock:
+                # 新进程在握手之后、这里之前又退出了：_on_server_exit 在重启期间不会安排重启，由这里继续
+                if recovered and self.exited_generation == self.generation and not self.stopping:
+                    logger.warning("💥 重启后的 MCP 服务器立即退出，再次重启")
+                    continue
+                self.restarting = False
+                self.failed = not recovered
+            break
+        
+        if recovered:
+            self.restarts += 1
+            self.last_recovery_ms = (time.perf_counter() - detected) * 1000
+            get_tracer().record("mcp.recovery", self.last_recovery_ms)
+            print(f"[green]♻️ MCP 服务器已恢复 (第 {self.restarts} 次重启，耗时 {self.last_recovery_ms:.1f} ms)[/green]")
+        self.ready.set()
+        if not recovered:
+            return
+        # 订阅不会保留在新进程中：重新订阅，并让本地镜像失效（服务器不在线期间数据可能已变化）
+        for uri in list(self.subscriptions):
+            self.subscribe_resource(uri)
+            self._dispatch_notification({"method": "notifications/resources/updated", "params": {"uri": uri}})
     
-    def send_request(self, method, params=None, timeout=10):
-        """发送请求并等待响应，支持超时"""
+    def _respawn(self):
+        """启动新进程并握手，最多尝试 3 次；握手失败的进程会被结束"""
+        now = time.monotonic()
+        while self.restart_times and self.restart_times[0] < now - self.restart_window:
+            self.restart_times.popleft()
+        if len(self.restart_times) >= self.max_restarts:
+            logger.error("❌ %s 秒内已重启 %s 次，不再重启 MCP 服务器", self.restart_window, len(self.restart_times))
+            return False
+        self.restart_times.append(now)
+        for attempt in range(3):
+            if self.stopping:
+                return False
+            if self._spawn():
+                if self._handshake():
+                    return True
+                self._kill(self.process)
+            time.sleep(0.2 * 2 ** attempt)
+        return False
+    
+    def _kill(self, process):
+        """结束进程并回收"""
+        if process.poll() is None:
+            process.kill()
+        try:
+            return process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            return None
+    
+    def _handshake(self, timeout=10):
+        """重启后的 initialize 握手（不经过 ready 和背压），工具列表沿用缓存"""
+        waiter = queue.Queue()
+        with self.pending_lock:
+            self.request_id += 1
+            request_id = self.request_id
+            self.pending[request_id] = waiter
+        try:
+            self._write_message({
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": "initialize",
+                "params": self._initialize_params()
+            })
+            response = waiter.get(timeout=timeout)
+            if response.get("method") == SERVER_EXITED or "error" in response:
+                return False
+            self.server_capabilities = response.get("result", {}).get("capabilities", {})
+            self._write_message({"jsonrpc": "2.0", "method": "notifications/initialized"})
+            return True
+        except (queue.Empty, OSError, ValueError) as e:
+            logger.warning("⚠️ 重启后握手失败: %s", str(e) or "超时")
+            return False
+        finally:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+    
+    def _replayable(self, method, params):
+        """请求能否在重启后的服务器上重放"""
+        if method in IDEMPOTENT_METHODS:
+            return True
+        if method == "tools/call":
+            tool = next((t for t in self.tools if t["name"] == (params or {}).get("name")), None)
+            annotations = (tool or {}).get("annotations") or {}
+            return bool(annotations.get("readOnlyHint") or annotations.get("idempotentHint"))
+        return False
+    
+    def _deliver(self, response):
+        """把响应交给对应的等待者；没有等待者时作为孤儿响应暂存
+
+        每次投递都顺带淘汰过期的孤儿响应，不依赖下一条孤儿响应或 memory_usage() 触发。
+        """
+        with self.pending_lock:
+            waiter = self.pending.pop(response.get("id"), None)
+            if waiter is None:
+                self.orphans[response.get("id")] = (time.monotonic(), response)
+                logger.warning("⚠️ 收到无人等待的响应 (id=%s)，可能是已超时的请求", response.get("id"))
+            self._evict_orphans()
+        if waiter is not None:
+            waiter.put_nowait(response)
+    
+    def _answer_server_request(self, request, process):
+        """回复服务器发来的请求（同时带 method 和 id）：ping 返回空结果，其余返回 -32601
+
+        客户端没有实现 sampling、roots 等能力，不回复的话服务器端会一直等到超时。
+        """
+        if request["method"] == "ping":
+            reply = {"jsonrpc": "2.0", "id": request["id"], "result": {}}
+        else:
+            logger.warning("⚠️ 不支持服务器请求 %s (id=%s)", request["method"], request["id"])
+            reply = {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32601, "message": f"Method not found: {request['method']}"}
+            }
+        try:
+            self._write_message(reply, process)
+        except (OSError, ValueError) as e:
+            logger.warning("回复服务器请求失败: %s", e)
+    
+    def _deliver_progress(self, notification):
+        """进度通知的 progressToken 就是请求 ID，交给同一个等待者处理"""
+        token = notification.get("params", {}).get("progressToken")
+        with self.pending_lock:
+            waiter = self.pending.get(token)
+        if waiter is not None:
+            waiter.put_nowait(notification)
+    
+    def _evict_orphans(self):
+        """按时间先后淘汰过期或超出数量上限的孤儿响应（调用方需持有 pending_lock）"""
+        deadline = time.monotonic() - self.orphan_ttl
+        while self.orphans:
+            received_at, _ = next(iter(self.orphans.values()))
+            if received_at >= deadline and len(self.orphans) <= self.max_orphans:
+                break
+            self.orphans.popitem(last=False)
+            self.orphans_evicted += 1
+    
+    def _buffer_stderr(self, line):
+        """只保留最近的错误输出，缓冲区满时丢弃最早的一条"""
+        if len(self.stderr_buffer) == self.stderr_buffer.maxlen:
+            self.stderr_dropped += 1
+        self.stderr_buffer.append(line)
+    
+    def _write_message(self, message, process=None):
+        """按行写入一条 JSON-RPC 消息（换行单独写入，避免拼接大字符串）"""
+        data = self.codec.dumps(message)
+        stdin = (process or self.process).stdin
+        # 多个线程共用 stdin，整条消息写完前不能被其他消息插入
+        with self.write_lock:
+            stdin.write(data)
+            stdin.write(b"\n")
+            stdin.flush()
+    
+    def send_request(self, method, params=None, timeout=10, on_progress=None):
+        """发送请求并等待响应，支持超时（记录 span 并通过 _meta 传递 trace 上下文）
+
+        传入 on_progress 时请求会带上 progressToken，服务器的每条进度通知
+        （params 中的 progress / total / message）都会在调用线程中回调，
+        并把超时重新计时，长时间运行但持续汇报进度的工具不会被判定超时。
+        """
+        with get_tracer().start_span(f"mcp.{method}", {"rpc.method": method}) as span:
+            response = self._send_request(method, inject_meta(params), timeout, on_progress)
+            if response is None or "error" in response:
+                span.status = "ERROR"
+            return response
+    
+    def _send_request(self, method, params, timeout, on_progress=None):
         if not self.process:
             raise Exception("MCP 服务器未启动")
         
-        self.request_id += 1
+        # 背压：进行中的请求达到上限时等待空位，超时则放弃
+        if not self.in_flight.acquire(timeout=timeout):
+            logger.error("⏳ 进行中的请求已达上限 (%s)，放弃请求: %s", self.max_in_flight, method)
+            return None
+        
+        waiter = queue.Queue()
+        with self.pending_lock:
+            self.request_id += 1
+            request_id = self.request_id
+            self.pending[request_id] = waiter
+        if on_progress:
+            params = with_progress_token(params, request_id)
         request = {
             "jsonrpc": "2.0",
-            "id": self.request_id,
+            "id": request_id,
             "method": method,
             "params": params or {}
         }
         
         try:
-            # 发送请求
-            request_json = json.dumps(request) + "\n"
-            print(f"📤 发送请求: {method}")
-            print(f"📝 请求内容: {request_json.strip()}")
-            
-            self.process.stdin.write(request_json)
-            self.process.stdin.flush()
-            
-            # 等待响应（带超时）
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                try:
-                    response = self.response_queue.get(timeout=1)
-                    if response.get("id") == self.request_id:
-                        print(f"✅ 收到匹配响应: {response}")
-                        return response
-                    else:
-                        # 如果 ID 不匹配，放回队列
-                        self.response_queue.put(response)
-                except queue.Empty:
-                    continue
-            
-            # 超时处理
-            print(f"[red]⏰ 请求超时 ({timeout}秒): {method}[/red]")
-            
-            # 检查是否有错误信息
-            error_messages = []
+            started = time.perf_counter()
+            generation = None  # 请求已写入的服务器进程代数，None 表示尚未写入
+            # 等待响应（带超时，每收到一条进度通知重新计时）
             try:
                 while True:
-                    error_msg = self.stderr_queue.get_nowait()
-                    error_messages.append(error_msg)
+                    if generation is None:
+                        # 服务器重启期间等待恢复
+                        if not self.ready.wait(timeout) or self.failed:
+                            logger.error("❌ MCP 服务器不可用，放弃请求: %s", method)
+                            return self._exited_response(request_id)
+                        with self.supervise_lock:
+                            process, generation = self.process, self.generation
+                        try:
+                            self._write_message(request, process)
+                        except (OSError, ValueError) as e:
+                            # 进程已退出，退出通知会投递到 waiter
+                            logger.warning("⚠️ 写入请求失败: %s", e)
+                            self._on_server_exit(process)
+                        logger.debug("📤 发送请求: %s (id=%s)", method, request_id)
+                        log_payload(self.payload_sampler, "📝 请求内容:", request)
+                    
+                    response = waiter.get(timeout=timeout)
+                    if response.get("method") == SERVER_EXITED:
+                        if response["params"]["generation"] != generation:
+                            continue  # 更早的进程退出，与本次写入无关
+                        if not self._replayable(method, params):
+                            logger.error("❌ MCP 服务器已退出，请求不可重放: %s", method)
+                            return self._exited_response(request_id)
+                        self.replayed += 1
+                        logger.info("🔁 服务器重启后重放请求: %s (id=%s)", method, request_id)
+                        generation = None
+                        continue
+                    if response.get("method") == "notifications/progress":
+                        notify_progress(on_progress, response)
+                        continue
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("✅ 收到匹配响应: %s (id=%s, %sms)", method, request_id, elapsed_ms(started))
+                    return response
             except queue.Empty:
                 pass
             
-            if error_messages:
-                print(f"[red]🔴 发现错误信息: {error_messages}[/red]")
+            # 超时处理
+            logger.error("⏰ 请求超时 (%s秒): %s", timeout, method)
+            
+            # 检查是否有错误信息
+            if self.stderr_buffer:
+                logger.error("🔴 发现错误信息: %s", list(self.stderr_buffer))
+                self.stderr_buffer.clear()
             
             return None
             
         except Exception as e:
-            print(f"❌ 发送请求失败: {e}")
+            logger.error("❌ 发送请求失败: %s", e)
             return None
+        finally:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+            self.in_flight.release()
     
-    def initialize(self):
-        """初始化 MCP 连接"""
-        print("🔄 开始初始化 MCP 连接...")
-        
-        response = self.send_request("initialize", {
+    def _exited_response(self, request_id):
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32000, "message": "MCP 服务器已退出"}}
+    
+    def _initialize_params(self):
+        return {
             "protocolVersion": "2024-11-05",
             "capabilities": {
                 "roots": {"listChanged": True},
@@ -166,19 +545,23 @@ class MCPStdioClient:
                 "name": "anime-calendar-client",
                 "version": "1.0.0"
             }
-        })
+        }
+    
+    def initialize(self):
+        """初始化 MCP 连接"""
+        print("🔄 开始初始化 MCP 连接...")
+        
+        response = self.send_request("initialize", self._initialize_params())
         
         if response and "error" not in response:
             print("[green]✅ MCP 连接初始化成功[/green]")
+            self.server_capabilities = response.get("result", {}).get("capabilities", {})
             
             # 发送 initialized 通知
-            initialized_request = {
+            self._write_message({
                 "jsonrpc": "2.0",
                 "method": "notifications/initialized"
-            }
-            request_json = json.dumps(initialized_request) + "\n"
-            self.process.stdin.write(request_json)
-            self.process.stdin.flush()
+            })
             print("📤 已发送 initialized 通知")
             
             return True
@@ -215,25 +598,52 @@ class MCPStdioClient:
             
             return []
     
-    def call_tool(self, tool_name, arguments=None):
-        """调用指定工具"""
-        print(f"🔧 调用工具: {tool_name}")
-        print(f"📝 工具参数: {arguments}")
+    def call_tool(self, tool_name, arguments=None, on_progress=None):
+        """调用指定工具，on_progress 用于接收进度通知"""
+        logger.info("🔧 调用工具: %s", tool_name)
+        log_payload(self.payload_sampler, "📝 工具参数:", arguments)
         
         response = self.send_request("tools/call", {
             "name": tool_name,
             "arguments": arguments or {}
-        })
+        }, on_progress=on_progress)
         
         if response and "result" in response:
-            print(f"✅ 工具执行成功: {response['result']}")
+            log_payload(self.payload_sampler, "✅ 工具执行成功:", response["result"])
             return response["result"]
         else:
-            print(f"❌ 工具调用失败: {response}")
+            logger.error("❌ 工具调用失败: %s", response)
             return None
     
+    def list_resources(self):
+        """获取资源列表和资源模板（resources/list + resources/templates/list）"""
+        resources = self.send_request("resources/list", timeout=15)
+        templates = self.send_request("resources/templates/list", timeout=15)
+        return (
+            resources["result"].get("resources", []) if resources and "result" in resources else [],
+            templates["result"].get("resourceTemplates", []) if templates and "result" in templates else [],
+        )
+    
+    def read_resource(self, uri):
+        """读取资源，返回 contents 列表"""
+        response = self.send_request("resources/read", {"uri": uri})
+        if response and "result" in response:
+            return response["result"].get("contents", [])
+        logger.error("❌ 读取资源失败: %s %s", uri, response)
+        return None
+    
+    def subscribe_resource(self, uri):
+        """订阅资源变更（notifications/resources/updated），服务器重启后会自动重新订阅"""
+        response = self.send_request("resources/subscribe", {"uri": uri})
+        if response and "result" in response:
+            self.subscriptions.add(uri)
+            return True
+        logger.warning("⚠️ 订阅资源失败: %s %s", uri, response)
+        return False
+    
     def stop_server(self):
         """停止 MCP 服务器"""
+        self.stopping = True
         if self.process:
             print("🔄 正在停止 MCP 服务器...")
             self.process.terminate()
@@ -244,8 +654,629 @@ class MCPStdioClient:
         """输出调试信息"""
         print("\n🔍 调试信息:")
         print(f"服务器进程状态: {'运行中' if self.process and self.process.poll() is None else '已停止'}")
-        print(f"响应队列大小: {self.response_queue.qsize()}")
-        print(f"错误队列大小: {self.stderr_queue.qsize()}")
+        memory = self.memory_usage()
+        print(f"等待中的请求: {memory['pending']} / {self.max_in_flight}")
+        print(f"孤儿响应: {memory['orphans']} (已淘汰 {self.orphans_evicted})")
+        print(f"错误输出缓冲: {memory['stderr_lines']} / {self.stderr_buffer.maxlen} (已丢弃 {self.stderr_dropped})")
+        print(f"缓冲区内存: {memory['bytes'] / 1024:.1f} KB")
+        recovery = f"{self.last_recovery_ms:.1f} ms" if self.last_recovery_ms is not None else "无"
+        print(f"服务器重启: {self.restarts} 次，重放请求: {self.replayed} 个，最近一次恢复耗时: {recovery}")
+    
+    def memory_usage(self):
+        """估算各缓冲区占用（孤儿响应按序列化后的大小计算）"""
+        with self.pending_lock:
+            self._evict_orphans()
+            pending = len(self.pending)
+            orphans = [response for _, response in self.orphans.values()]
+        stderr_lines = list(self.stderr_buffer)
+        size = sum(len(self.codec.dumps(response)) for response in orphans)
+        size += sum(sys.getsizeof(line) for line in stderr_lines)
+        return {"pending": pending, "orphans": len(orphans), "stderr_lines": len(stderr_lines), "bytes": size}
+
+
+class SSEParser:
+    """增量解析 text/event-stream 数据流"""
+
+    def __init__(self):
+        self._buffer = b""
+        self._reset()
+
+    def _reset(self):
+        self._event = "message"
+        self._data = []
+        self._id = None
+
+    def feed(self, chunk):
+        """输入一段原始字节，返回已完整解析的事件列表"""
+        self._buffer += chunk
+        events = []
+        while True:
+            newline = self._buffer.find(b"\n")
+            if newline < 0:
+                break
+            line = self._buffer[:newline].rstrip(b"\r").decode("utf-8")
+            self._buffer = self._buffer[newline + 1:]
+            if not line:
+                # 空行表示一个事件结束
+                if self._data:
+                    events.append({
+                        "event": self._event,
+                        "data": "\n".join(self._data),
+                        "id": self._id
+                    })
+                self._reset()
+                continue
+            if line.startswith(":"):
+                continue  # 注释/心跳
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+            if field == "event":
+                self._event = value
+            elif field == "data":
+                self._data.append(value)
+            elif field == "id":
+                self._id = value
+            elif field == "retry" and value.isdigit():
+                events.append({"event": "retry", "data": value, "id": None})
+        return events
+
+
+class MCPHttpClient:
+    """远程 HTTP MCP 客户端，支持 streamable-http 和 sse 两种传输方式
+
+    接口与 MCPStdioClient 保持一致（start_server / initialize / list_tools /
+    call_tool / stop_server），底层使用带连接池的 keep-alive 会话。
+    """
+
+    def __init__(self, url, transport="streamable-http", headers=None, pool_size=10, max_reconnects=3,
+                 codec=None, payload_sampler=None):
+        self.url = url
+        self.transport = transport
+        self.codec = get_codec(codec)
+        self.payload_sampler = payload_sampler or PayloadSampler()
+        self.tools = []
+        self.server_capabilities = {}
+        self.request_id = 0
+        self.session_id = None
+        self.listener = None
+        self.last_event_id = None
+        self.retry_delay = 1.0
+        self.max_reconnects = max_reconnects
+        self.message_endpoint = None
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.progress_handlers = {}
+        self.connected = threading.Event()
+        self.closed = False
+        self.notification_handlers = {}
+
+        # 复用 TCP/TLS 连接，避免每次工具调用重新握手
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.http.headers.update({"Connection": "keep-alive", "Content-Type": "application/json"})
+        if headers:
+            self.http.headers.update(headers)
+
+    def on_notification(self, method, handler):
+        """注册服务器通知回调"""
+        self.notification_handlers.setdefault(method, []).append(handler)
+
+    def _headers(self, accept):
+        headers = {"Accept": accept}
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+        return headers
+
+    def start_server(self):
+        """连接远程 MCP 服务器（sse 传输需要先建立事件流）"""
+        if self.transport == "sse":
+            threading.Thread(target=self._sse_listen, daemon=True).start()
+            if not self.connected.wait(timeout=10):
+                print(f"[red]❌ 连接 SSE 端点超时: {self.url}[/red]")
+                return False
+        print(f"[green]✅ 已连接远程 MCP 服务器 ({self.transport}): {self.url}[/green]")
+        return True
+
+    def _sse_listen(self):
+        """sse 传输：长连接读取事件流，断线后携带 Last-Event-ID 重连"""
+        reconnects = 0
+        while not self.closed:
+            headers = self._headers("text/event-stream")
+            if self.last_event_id:
+                headers["Last-Event-ID"] = self.last_event_id
+            try:
+                with self.http.get(self.url, headers=headers, stream=True, timeout=(5, None)) as response:
+                    response.raise_for_status()
+                    reconnects = 0
+                    parser = SSEParser()
+                    for chunk in response.iter_content(chunk_size=None):
+                        for event in parser.feed(chunk):
+                            self._handle_sse_event(event)
+            except requests.RequestException as e:
+                if self.closed:
+                    break
+                logger.warning("⚠️ SSE 连接中断: %s", e)
+            reconnects += 1
+            if self.closed or reconnects > self.max_reconnects:
+                break
+            time.sleep(self.retry_delay)
+
+    def _handle_sse_event(self, event):
+        """处理单个 SSE 事件，返回其中携带的 JSON-RPC 消息（如有）"""
+        if event["id"]:
+            self.last_event_id = event["id"]
+        if event["event"] == "retry":
+            self.retry_delay = int(event["data"]) / 1000
+            return None
+        if event["event"] == "endpoint":
+            self.message_endpoint = urljoin(self.url, event["data"])
+            self.connected.set()
+            return None
+        if event["event"] != "message":
+            return None
+        log_payload(self.payload_sampler, "📥 收到服务器事件:", event["data"])
+        try:
+            message = self.codec.loads(event["data"])
+        except self.codec.DecodeError as e:
+            logger.warning("JSON 解析错误: %s, 原始数据: %.200s", e, event["data"])
+            return None
+        if "id" in message and ("result" in message or "error" in message):
+            with self.pending_lock:
+                waiter = self.pending.get(message["id"])
+            if waiter:
+                waiter.put(message)
+        elif "method" in message and "id" not in message:
+            logger.debug("📨 收到服务器通知: %s", message["method"])
+            if message["method"] == "notifications/progress":
+                self._deliver_progress(message)
+            for handler in self.notification_handlers.get(message["method"], []):
+                handler(message.get("params", {}))
+        return message
+
+    def _deliver_progress(self, notification):
+        """streamable-http 下进度通知在调用线程的响应流中，直接回调；
+        sse 传输由监听线程收到，交给等待者以便重新计时"""
+        token = notification.get("params", {}).get("progressToken")
+        on_progress = self.progress_handlers.get(token)
+        if on_progress is None:
+            return
+        if self.transport == "sse":
+            with self.pending_lock:
+                waiter = self.pending.get(token)
+            if waiter:
+                waiter.put(notification)
+        else:
+            notify_progress(on_progress, notification)
+
+    def _read_stream(self, response, request_id):
+        """增量读取 streamable-http 的 SSE 响应，直到拿到对应 ID 的结果"""
+        parser = SSEParser()
+        for chunk in response.iter_content(chunk_size=None):
+            for event in parser.feed(chunk):
+                message = self._handle_sse_event(event)
+                if message and message.get("id") == request_id and "method" not in message:
+                    return message
+        return None
+
+    def _resume_stream(self, request_id, timeout):
+        """流中断后通过 GET + Last-Event-ID 恢复，继续等待响应"""
+        for attempt in range(self.max_reconnects):
+            time.sleep(self.retry_delay)
+            headers = self._headers("text/event-stream")
+            headers["Last-Event-ID"] = self.last_event_id
+            try:
+                with self.http.get(self.url, headers=headers, stream=True, timeout=(5, timeout)) as response:
+                    if response.status_code == 405:
+                        return None  # 服务器不支持断点续传
+                    response.raise_for_status()
+                    message = self._read_stream(response, request_id)
+                    if message:
+                        return message
+            except requests.RequestException as e:
+                logger.warning("⚠️ 第 %s 次恢复事件流失败: %s", attempt + 1, e)
+        return None
+
+    def _post(self, payload, timeout):
+        body = self.codec.dumps(payload)
+        if self.transport == "sse":
+            return self.http.post(self.message_endpoint, data=body, timeout=(5, timeout))
+        return self.http.post(
+            self.url,
+            data=body,
+            headers=self._headers("application/json, text/event-stream"),
+            stream=True,
+            timeout=(5, timeout)
+        )
+
+    def send_request(self, method, params=None, timeout=10, on_progress=None):
+        """发送请求并等待响应，支持超时（记录 span 并通过 _meta 传递 trace 上下文）
+
+        on_progress 的语义与 MCPStdioClient.send_request 相同。
+        """
+        with get_tracer().start_span(f"mcp.{method}", {"rpc.method": method}) as span:
+            response = self._send_request(method, inject_meta(params), timeout, on_progress)
+            if response is None or "error" in response:
+                span.status = "ERROR"
+            return response
+
+    def _send_request(self, method, params, timeout, on_progress=None):
+        with self.pending_lock:
+            self.request_id += 1
+            request_id = self.request_id
+        if on_progress:
+            params = with_progress_token(params, request_id)
+            self.progress_handlers[request_id] = on_progress
+        request = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": method,
+            "params": params or {}
+        }
+        logger.debug("📤 发送请求: %s (id=%s)", method, request_id)
+        log_payload(self.payload_sampler, "📝 请求内容:", request)
+
+        waiter = queue.Queue()
+        with self.pending_lock:
+            self.pending[request_id] = waiter
+        try:
+            with self._post(request, timeout) as response:
+                response.raise_for_status()
+                if self.transport == "sse":
+                    while True:
+                        message = waiter.get(timeout=timeout)
+                        if message.get("method") != "notifications/progress":
+                            return message
+                        notify_progress(on_progress, message)
+
+                if "Mcp-Session-Id" in response.headers:
+                    self.session_id = response.headers["Mcp-Session-Id"]
+                content_type = response.headers.get("Content-Type", "")
+                if content_type.startswith("application/json"):
+                    log_payload(self.payload_sampler, "📥 收到服务器响应:", response.content)
+                    return self.codec.loads(response.content)
+                try:
+                    message = self._read_stream(response, request_id)
+                except requests.RequestException as e:
+                    logger.warning("⚠️ 响应流中断: %s", e)
+                    message = None
+            if message is None and self.last_event_id:
+                message = self._resume_stream(request_id, timeout)
+            return message
+        except queue.Empty:
+            logger.error("⏰ 请求超时 (%s秒): %s", timeout, method)
+            return None
+        except requests.RequestException as e:
+            logger.error("❌ 发送请求失败: %s", e)
+            return None
+        finally:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+            self.progress_handlers.pop(request_id, None)
+
+    def send_notification(self, method, params=None):
+        """发送不需要响应的通知"""
+        notification = {"jsonrpc": "2.0", "method": method}
+        if params:
+            notification["params"] = params
+        try:
+            with self._post(notification, 10) as response:
+                response.raise_for_status()
+        except requests.RequestException as e:
+            logger.error("❌ 发送通知失败: %s", e)
+
+    def initialize(self):
+        """初始化 MCP 连接"""
+        print("🔄 开始初始化 MCP 连接...")
+
+        response = self.send_request("initialize", {
+            "protocolVersion": "2025-03-26",
+            "capabilities": {
+                "roots": {"listChanged": True},
+                "sampling": {}
+            },
+            "clientInfo": {
+                "name": "anime-calendar-client",
+                "version": "1.0.0"
+            }
+        })
+
+        if response and "error" not in response:
+            print("[green]✅ MCP 连接初始化成功[/green]")
+            self.server_capabilities = response.get("result", {}).get("capabilities", {})
+            self.send_notification("notifications/initialized")
+            print("📤 已发送 initialized 通知")
+            return True
+        else:
+            print(f"❌ MCP 初始化失败: {response}")
+            return False
+
+    def list_tools(self):
+        """获取可用工具列表"""
+        print("🔄 正在获取工具列表...")
+
+        response = self.send_request("tools/list", timeout=15)
+
+        if response and "result" in response:
+            self.tools = response["result"].get("tools", [])
+            print(f"✅ 获取到 {len(self.tools)} 个工具:")
+            for tool in self.tools:
+                print(f"  - {tool['name']}: {tool.get('description', '无描述')}")
+            return self.tools
+        print(f"❌ 获取工具列表失败: {response}")
+        return []
+
+    def call_tool(self, tool_name, arguments=None, on_progress=None):
+        """调用指定工具，on_progress 用于接收进度通知"""
+        logger.info("🔧 调用工具: %s", tool_name)
+        log_payload(self.payload_sampler, "📝 工具参数:", arguments)
+
+        response = self.send_request("tools/call", {
+            "name": tool_name,
+            "arguments": arguments or {}
+        }, on_progress=on_progress)
+
+        if response and "result" in response:
+            log_payload(self.payload_sampler, "✅ 工具执行成功:", response["result"])
+            return response["result"]
+        else:
+            logger.error("❌ 工具调用失败: %s", response)
+            return None
+
+    def list_resources(self):
+        """获取资源列表和资源模板（resources/list + resources/templates/list）"""
+        resources = self.send_request("resources/list", timeout=15)
+        templates = self.send_request("resources/templates/list", timeout=15)
+        return (
+            resources["result"].get("resources", []) if resources and "result" in resources else [],
+            templates["result"].get("resourceTemplates", []) if templates and "result" in templates else [],
+        )
+
+    def read_resource(self, uri):
+        """读取资源，返回 contents 列表"""
+        response = self.send_request("resources/read", {"uri": uri})
+        if response and "result" in response:
+            return response["result"].get("contents", [])
+        logger.error("❌ 读取资源失败: %s %s", uri, response)
+        return None
+
+    def subscribe_resource(self, uri):
+        """订阅资源变更
+
+        streamable-http 下与请求无关的通知通过 GET 事件流推送，第一次订阅时建立该事件流。
+        """
+        response = self.send_request("resources/subscribe", {"uri": uri})
+        if not (response and "result" in response):
+            logger.warning("⚠️ 订阅资源失败: %s %s", uri, response)
+            return False
+        if self.transport != "sse" and self.listener is None:
+            self.listener = threading.Thread(target=self._sse_listen, daemon=True)
+            self.listener.start()
+        return True
+
+    def stop_server(self):
+        """断开远程连接（streamable-http 会显式结束会话）"""
+        self.closed = True
+        if self.transport != "sse" and self.session_id:
+            try:
+                self.http.delete(self.url, headers=self._headers("application/json"), timeout=5)
+            except requests.RequestException:
+                pass
+        self.http.close()
+        print("✅ 已断开远程 MCP 服务器")
+
+    def debug_info(self):
+        """输出调试信息"""
+        print("\n🔍 调试信息:")
+        print(f"服务器地址: {self.url} ({self.transport})")
+        print(f"会话 ID: {self.session_id}")
+        print(f"最后事件 ID: {self.last_event_id}")
+        print(f"等待中的请求: {len(self.pending)}")
+
+
+class MCPToolRouter:
+    """多服务器工具路由
+
+    并行连接多个 MCP 服务器，把各自的 tools/list 合并为带命名空间的工具列表
+    （"服务器名__工具名"），并维护一份预先构建好的 名称 -> (客户端, 原始工具名)
+    分发表。收到 notifications/tools/list_changed 时只标记对应服务器，
+    下一次读取 tools 时再刷新，不会在每次查询时重建。
+
+    声明为只读的工具（见 mcp_cache.cache_ttl）的结果按 (服务器, 工具, 规范化参数)
+    缓存在客户端，设置 MCP_TOOL_CACHE=0 可关闭。
+
+    每个工具的 inputSchema 在工具列表变化时编译为校验函数，参数不合法的调用
+    直接在本地返回 isError 结果，不再发送到服务器。
+
+    声明了 resources.subscribe 能力的服务器会创建资源镜像（mcp_cache.ResourceMirror），
+    read_resource 按 URI scheme 找到对应服务器，内容未变化时直接返回本地副本；
+    收到资源更新通知时同时清除该服务器的工具结果缓存。
+
+    对外接口与单个客户端一致，可直接传给 query_with_mcp_tools。
+    """
+
+    SEPARATOR = "__"
+
+    def __init__(self, clients, cache=None):
+        self.clients = dict(clients)
+        self.server_tools = {}
+        self.dispatch = {}
+        self.cache_ttls = {}
+        self.validators = {}
+        self.schema_validators = SchemaValidators()
+        self.tools_version = 0
+        self.rejected_calls = 0
+        self.mirrors = {}  # 服务器名 -> ResourceMirror
+        self.resource_schemes = {}  # URI scheme -> 服务器名
+        if cache is None and os.environ.get("MCP_TOOL_CACHE", "1") != "0":
+            cache = ToolResultCache()
+        self.cache = cache
+        self._tools = []
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _connect(self, name, mcp_client):
+        """启动、初始化单个服务器并获取工具列表"""
+        if not mcp_client.start_server():
+            return False
+        if not mcp_client.initialize():
+            return False
+        mcp_client.on_notification(
+            "notifications/tools/list_changed",
+            lambda params, name=name: self._mark_dirty(name)
+        )
+        self.server_tools[name] = mcp_client.list_tools()
+        resources = mcp_client.server_capabilities.get("resources")
+        if resources is not None:
+            static, templates = mcp_client.list_resources()
+            uris = [r["uri"] for r in static] + [t["uriTemplate"] for t in templates]
+            for uri in uris:
+                self.resource_schemes[uri.partition("://")[0]] = name
+            if resources.get("subscribe"):
+                self.mirrors[name] = ResourceMirror(
+                    mcp_client, on_update=lambda uri, name=name: self._resource_updated(name, uri)
+                )
+        return True
+
+    def start_server(self):
+        """并行启动所有服务器，连接失败的服务器会被移除"""
+        with ThreadPoolExecutor(max_workers=len(self.clients) or 1) as executor:
+            futures = {
+                name: executor.submit(self._connect, name, mcp_client)
+                for name, mcp_client in self.clients.items()
+            }
+        for name, future in futures.items():
+            try:
+                connected = future.result()
+            except Exception as e:
+                print(f"[red]❌ 连接服务器 {name} 出错: {e}[/red]")
+                connected = False
+            if not connected:
+                print(f"[red]❌ 服务器 {name} 不可用，已跳过[/red]")
+                self.clients.pop(name).stop_server()
+                self.server_tools.pop(name, None)
+                self.mirrors.pop(name, None)
+        self._rebuild()
+        return bool(self.clients)
+
+    def initialize(self):
+        """初始化已在 start_server 中并行完成"""
+        return bool(self.clients)
+
+    def _mark_dirty(self, name):
+        print(f"🔔 服务器 {name} 的工具列表已变更")
+        with self._lock:
+            self._dirty.add(name)
+
+    def _resource_updated(self, name, uri):
+        logger.info("🔔 服务器 %s 的资源已更新: %s", name, uri)
+        if self.cache:
+            self.cache.invalidate(name)
+
+    def _rebuild(self):
+        """重建合并后的工具列表和分发表"""
+        tools = []
+        dispatch = {}
+        cache_ttls = {}
+        validators = {}
+        for name, server_tools in self.server_tools.items():
+            for tool in server_tools:
+                namespaced = f"{name}{self.SEPARATOR}{tool['name']}"
+                tools.append({**tool, "name": namespaced})
+                dispatch[namespaced] = (self.clients[name], tool["name"])
+                cache_ttls[namespaced] = cache_ttl(tool)
+                validators[namespaced] = self.schema_validators.get(tool.get("inputSchema"))
+        self._tools = tools
+        self.dispatch = dispatch
+        self.cache_ttls = cache_ttls
+        self.validators = validators
+        self.tools_version += 1
+
+    @property
+    def tools(self):
+        """合并后的工具列表，存在变更通知时先刷新对应服务器"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if dirty:
+            for name in dirty:
+                if name in self.clients:
+                    self.server_tools[name] = self.clients[name].list_tools()
+                    if self.cache:
+                        self.cache.invalidate(name)
+            self._rebuild()
+        return self._tools
+
+    def list_tools(self):
+        """获取合并后的工具列表"""
+        tools = self.tools
+        print(f"✅ 共 {len(self.clients)} 个服务器，{len(tools)} 个工具")
+        return tools
+
+    def call_tool(self, tool_name, arguments=None, on_progress=None):
+        """根据命名空间把调用分发到对应服务器"""
+        target = self.dispatch.get(tool_name)
+        if not target:
+            print(f"❌ 未知工具: {tool_name}")
+            return None
+        mcp_client, original_name = target
+        errors = self.validators[tool_name](arguments if arguments is not None else {})
+        if errors:
+            # 参数不合法时不经过服务器，直接返回可供模型修正的错误
+            self.rejected_calls += 1
+            logger.warning("⚠️ 工具参数校验失败: %s %s", tool_name, errors)
+            return invalid_arguments_result(tool_name, errors)
+        ttl = self.cache_ttls.get(tool_name, 0) if self.cache else 0
+        if not ttl:
+            return mcp_client.call_tool(original_name, arguments, on_progress=on_progress)
+
+        server = tool_name.partition(self.SEPARATOR)[0]
+        result = self.cache.get(server, original_name, arguments)
+        if result is not None:
+            logger.info("💾 工具结果命中缓存: %s", tool_name)
+            return result
+        result = mcp_client.call_tool(original_name, arguments, on_progress=on_progress)
+        # 失败或工具报错的结果不缓存
+        if result and not result.get("isError"):
+            self.cache.put(server, original_name, arguments, result, ttl)
+        return result
+
+    def read_resource(self, uri):
+        """读取资源，服务器支持订阅时优先使用本地镜像"""
+        name = self.resource_schemes.get(uri.partition("://")[0])
+        if name not in self.clients:
+            print(f"❌ 没有服务器提供该资源: {uri}")
+            return None
+        mirror = self.mirrors.get(name)
+        if mirror:
+            return mirror.get(uri)
+        return self.clients[name].read_resource(uri)
+
+    def stop_server(self):
+        """停止所有服务器"""
+        for mcp_client in self.clients.values():
+            mcp_client.stop_server()
+
+    def debug_info(self):
+        """输出所有服务器的调试信息"""
+        for name, mcp_client in self.clients.items():
+            print(f"\n📡 服务器: {name}")
+            mcp_client.debug_info()
+        print(f"\n🧾 工具列表版本: {self.tools_version}，本地拒绝的无效调用: {self.rejected_calls}")
+        if self.cache:
+            print(f"\n💾 工具结果缓存: {len(self.cache.entries)} 条")
+            self.cache.print_report()
+        for name, mirror in self.mirrors.items():
+            print(f"\n🪞 资源镜像 ({name}): ", end="")
+            mirror.print_report()
+
+
+def invalid_arguments_result(tool_name, errors):
+    """参数校验失败时的工具结果，格式与服务器返回的 isError 结果一致"""
+    text = f"工具 {tool_name} 的参数不合法，请修正后重试:\n" + "\n".join(f"- {error}" for error in errors)
+    return {"content": [{"type": "text", "text": text}], "isError": True}
+
 
 def create_anthropic_tools_from_mcp(mcp_tools):
     """将 MCP 工具转换为 Anthropic API 格式"""
@@ -259,14 +1290,255 @@ def create_anthropic_tools_from_mcp(mcp_tools):
         anthropic_tools.append(anthropic_tool)
     return anthropic_tools
 
-def query_with_mcp_tools(query, mcp_client, conversation_history=None):
-    """使用 MCP 工具进行查询，支持多轮对话和流式输出"""
+class ProgressPrinter:
+    """打印工具的进度通知，并记录首条进度到达的耗时"""
+
+    def __init__(self, tool_name):
+        self.tool_name = tool_name
+        self.started = time.perf_counter()
+        self.received = 0
+
+    def __call__(self, params):
+        if not self.received:
+            get_tracer().record("tool_call.first_progress", (time.perf_counter() - self.started) * 1000)
+        self.received += 1
+        message = params.get("message")
+        if message:
+            print(f"[dim]{escape(message.rstrip())}[/dim]")
+
+
+WEEKDAY_CHARS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "日": 7, "天": 7}
+WEEKDAY_PATTERN = re.compile(r"(?:星期|周|礼拜)([一二三四五六日天])")
+
+
+def calendar_rule(query, tools):
+    """番剧日历的预测规则：按查询中的“今天/明天/星期X/本周”推断 weekday"""
+    tool = next((t for t in tools if t["name"].rpartition(MCPToolRouter.SEPARATOR)[2] == "get_anime_calendar"), None)
+    if tool is None:
+        return []
+    match = WEEKDAY_PATTERN.search(query)
+    if match:
+        return [(tool["name"], {"weekday": WEEKDAY_CHARS[match.group(1)]})]
+    if "今天" in query or "今日" in query:
+        return [(tool["name"], {"weekday": date.today().isoweekday()})]
+    if "明天" in query:
+        return [(tool["name"], {"weekday": (date.today() + timedelta(days=1)).isoweekday()})]
+    if any(word in query for word in ("这周", "本周", "一周", "整周", "每周")):
+        return [(tool["name"], {})]
+    return []
+
+
+def _bigrams(text):
+    text = re.sub(r"\W+", "", text.lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+class Speculation:
+    """一次查询中已经发出的推测调用"""
+
+    def __init__(self, query):
+        self.query = query
+        self.futures = {}  # 调用键 -> (Future, 开始时间)
+        self.used = set()
+
+
+class SpeculativePrefetcher:
+    """推测性工具预取（默认关闭，设置 MCP_PREFETCH=1 开启）
+
+    在第一次模型流式调用的同时，按规则（rules）或相似查询的历史调用预测模型
+    会请求的只读工具，在线程池中提前执行；模型的 tool_use 与预测的
+    (工具名, 补全默认值后的参数) 一致时直接使用预取结果，不一致的结果丢弃。
+    只会预取注解为 readOnlyHint=true 且不是 destructiveHint 的工具。
+    命中但预取尚未完成时最多等待 take_timeout 秒，超时则由调用方正常调用工具。
+    """
+
+    def __init__(self, mcp_client, rules=None, max_predictions=2, history_size=256, min_similarity=0.5,
+                 take_timeout=2.0):
+        self.mcp_client = mcp_client
+        self.take_timeout = take_timeout
+        self.rules = [calendar_rule] if rules is None else list(rules)
+        self.max_predictions = max_predictions
+        self.min_similarity = min_similarity
+        self.history = deque(maxlen=history_size)  # (查询 bigram 集合, [(工具名, 参数)])
+        self.executor = ThreadPoolExecutor(max_workers=max_predictions, thread_name_prefix="prefetch")
+        self.stats = {"queries": 0, "predicted": 0, "hits": 0, "wasted": 0, "timeouts": 0, "saved_ms": 0.0}
+        self._lock = threading.Lock()
+
+    def _call_key(self, tools, tool_name, arguments):
+        """(工具名, 规范化参数)，参数先补全 inputSchema 中的默认值"""
+        tool = tools.get(tool_name)
+        properties = (tool.get("inputSchema") or {}).get("properties", {}) if tool else {}
+        filled = {name: spec["default"] for name, spec in properties.items()
+                  if isinstance(spec, dict) and "default" in spec}
+        filled.update(arguments or {})
+        return tool_name, canonical_arguments(filled)
+
+    def predict(self, query, tools):
+        """预测本次查询会调用的只读工具，返回 [(工具名, 参数)]"""
+        calls = []
+        for rule in self.rules:
+            calls.extend(rule(query, list(tools.values())))
+        if not calls:
+            grams = _bigrams(query)
+            best, similarity = None, 0.0
+            with self._lock:
+                history = list(self.history)
+            for past_grams, past_calls in history:
+                score = len(grams & past_grams) / len(grams | past_grams)
+                if score > similarity:
+                    best, similarity = past_calls, score
+            if best and similarity >= self.min_similarity:
+                calls.extend(best)
+
+        predictions = {}
+        for tool_name, arguments in calls:
+            annotations = (tools.get(tool_name) or {}).get("annotations") or {}
+            if not annotations.get("readOnlyHint") or annotations.get("destructiveHint"):
+                continue
+            predictions.setdefault(self._call_key(tools, tool_name, arguments), (tool_name, arguments))
+        return list(predictions.items())[:self.max_predictions]
+
+    def start(self, query):
+        """为本次查询发出推测调用，返回 Speculation"""
+        tools = {tool["name"]: tool for tool in self.mcp_client.tools}
+        speculation = Speculation(query)
+        for key, (tool_name, arguments) in self.predict(query, tools):
+            context = contextvars.copy_context()
+            future = self.executor.submit(context.run, self._prefetch, tool_name, arguments)
+            speculation.futures[key] = (future, time.perf_counter())
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["predicted"] += len(speculation.futures)
+        if speculation.futures:
+            logger.info("🔮 预取工具调用: %s", [key[0] for key in speculation.futures])
+        return speculation
+
+    def _prefetch(self, tool_name, arguments):
+        with get_tracer().start_span("tool_call.prefetch", {"tool.name": tool_name}):
+            result = self.mcp_client.call_tool(tool_name, arguments)
+        return result, time.perf_counter()
+
+    def take(self, speculation, tool_name, arguments):
+        """模型请求的调用与预测一致时返回预取结果（最多等待 take_timeout 秒），否则返回 None"""
+        tools = {tool["name"]: tool for tool in self.mcp_client.tools}
+        key = self._call_key(tools, tool_name, arguments)
+        entry = speculation.futures.get(key)
+        if entry is None or key in speculation.used:
+            return None
+        future, started = entry
+        requested = time.perf_counter()
+        try:
+            result, finished = future.result(timeout=self.take_timeout)
+        except FutureTimeoutError:
+            # 预取卡住（服务器慢或在重启）时不无限等待，回退到带进度显示的正常调用
+            with self._lock:
+                self.stats["timeouts"] += 1
+            logger.warning("⚠️ 预取 %s 超过 %.1f 秒未完成，改为直接调用", tool_name, self.take_timeout)
+            return None
+        except Exception as e:
+            logger.warning("⚠️ 预取调用失败: %s %s", tool_name, e)
+            return None
+        if result is None:
+            return None
+        speculation.used.add(key)
+        # 节省的时间 = 正常调用耗时 - 实际等待时间
+        saved_ms = ((finished - started) - max(0.0, finished - requested)) * 1000
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["saved_ms"] += saved_ms
+        logger.info("🔮 预取命中: %s，节省 %.1f ms", tool_name, saved_ms)
+        return result
+
+    def finish(self, speculation, tool_calls):
+        """一轮结束：丢弃未被使用的预取结果，并把实际调用记入历史"""
+        wasted = [key for key in speculation.futures if key not in speculation.used]
+        for key in wasted:
+            speculation.futures[key][0].cancel()
+        with self._lock:
+            self.stats["wasted"] += len(wasted)
+            self.history.append((_bigrams(speculation.query), list(tool_calls)))
+
+    def close(self):
+        """取消排队中的预取并关闭线程池，不等待正在执行的调用"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["predicted"], 3) if stats["predicted"] else 0.0
+        stats["saved_ms"] = round(stats["saved_ms"], 1)
+        return stats
+
+    def print_report(self):
+        stats = self.report()
+        print(f"查询 {stats['queries']}，预取 {stats['predicted']}，命中 {stats['hits']}，"
+              f"丢弃 {stats['wasted']}，等待超时 {stats['timeouts']}，命中率 {stats['hit_rate']:.1%}，共节省 {stats['saved_ms']:.1f} ms")
+
+
+def stream_claude(stage, routing=None, **kwargs):
+    """调用 Claude 流式 API 并逐个产出事件，记录该阶段的首 token 时间和总耗时
+
+    模型和 max_tokens 由路由策略按阶段决定（默认 model_routing），收到 message_stop 时记录路由决策。
+    span 名为 claude.<stage>，首 token 时间记录在 claude.<stage>.ttft 直方图中。
+    """
+    routing = routing or model_routing
+    kwargs = {**routing.route(stage), **kwargs}
+    tracer = get_tracer()
+    span = tracer.start_span(f"claude.{stage}", {"model": kwargs["model"], "max_tokens": kwargs["max_tokens"]})
+    started = time.perf_counter()
+    ttft_ms = None
+    usage = {}
+    recorded = False
+    
+    def finish():
+        # 调用方在 message_stop 后 break 但不关闭生成器，必须在这里结束 span 并记录路由，
+        # 否则耗时会一直算到生成器被回收（包含后续的工具调用和 follow_up）
+        nonlocal recorded
+        span.end()
+        if not recorded:
+            recorded = True
+            routing.record(stage, kwargs["model"], kwargs["max_tokens"], ttft_ms,
+                           (time.perf_counter() - started) * 1000, **usage)
+    
+    try:
+        for chunk in client.messages.create(stream=True, **kwargs):
+            if ttft_ms is None and chunk.type == "content_block_delta":
+                ttft_ms = (time.perf_counter() - started) * 1000
+                tracer.record(f"claude.{stage}.ttft", ttft_ms)
+                span.set_attribute("ttft_ms", round(ttft_ms, 1))
+            elif chunk.type == "message_start" and chunk.message.usage:
+                usage["input_tokens"] = chunk.message.usage.input_tokens
+            elif chunk.type == "message_delta" and chunk.usage:
+                usage["output_tokens"] = chunk.usage.output_tokens
+            if chunk.type == "message_stop":
+                finish()
+            yield chunk
+    except Exception:
+        span.status = "ERROR"
+        raise
+    finally:
+        span.end()
+    finish()
+
+
+def query_with_mcp_tools(query, mcp_client, conversation_history=None, prefetcher=None):
+    """使用 MCP 工具进行查询，支持多轮对话和流式输出
+
+    传入 prefetcher（SpeculativePrefetcher）时，在第一次模型调用的同时预取可能用到的只读工具。
+    """
+    with get_tracer().start_span("query"):
+        return _query_with_mcp_tools(query, mcp_client, conversation_history, prefetcher)
+
+
+def _query_with_mcp_tools(query, mcp_client, conversation_history, prefetcher=None):
     print(f"\n🤖 开始处理查询: {query}")
     
     # 如果没有提供对话历史，创建新的
     if conversation_history is None:
         conversation_history = []
     
+    speculation = None
+    tool_calls = []
     try:
         # 获取 MCP 工具并转换格式
         mcp_tools = mcp_client.tools
@@ -281,18 +1553,20 @@ def query_with_mcp_tools(query, mcp_client, conversation_history=None):
         messages = conversation_history.copy()
         messages.append({"role": "user", "content": query})
         
+        # 在模型生成回复的同时预取可能用到的只读工具
+        if prefetcher:
+            speculation = prefetcher.start(query)
+        
         # 调用 Claude API（流式）
         print("📞 正在调用 Claude API...")
         print("\n💬 Claude 回复:")
         print("-" * 40)
         
         # 使用流式 API
-        response_stream = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=2000,
+        response_stream = stream_claude(
+            "stream",
             messages=messages,
-            tools=anthropic_tools,
-            stream=True
+            tools=anthropic_tools
         )
         
         # 处理流式响应
@@ -369,23 +1643,35 @@ def query_with_mcp_tools(query, mcp_client, conversation_history=None):
                     
                     print(f"\n🔧 Claude 要求调用工具: {tool_name}")
                     print(f"📝 工具参数: {tool_args}")
+                    tool_calls.append((tool_name, tool_args))
                     
-                    # 调用 MCP 工具
-                    tool_result = mcp_client.call_tool(tool_name, tool_args)
+                    # 调用 MCP 工具，边执行边显示服务器推送的进度；预取命中时直接使用预取结果
+                    with get_tracer().start_span("tool_call", {"tool.name": tool_name}) as span:
+                        tool_result = prefetcher.take(speculation, tool_name, tool_args) if speculation else None
+                        if tool_result is not None:
+                            span.set_attribute("prefetched", True)
+                            print("🔮 使用预取结果")
+                        else:
+                            tool_result = mcp_client.call_tool(
+                                tool_name, tool_args, on_progress=ProgressPrinter(tool_name)
+                            )
                     
                     if tool_result:
-                        print(f"✅ 工具执行结果: {tool_result}")
+                        print("✅ 工具执行完成")
+                        log_payload(default_payload_sampler, "✅ 工具执行结果:", tool_result)
                         tool_results.append({
                             "type": "tool_result",
                             "tool_use_id": tool_use_id,
-                            "content": json.dumps(tool_result, ensure_ascii=False)
+                            "content": json.dumps(tool_result, ensure_ascii=False),
+                            "is_error": bool(tool_result.get("isError"))
                         })
                     else:
                         print("❌ 工具执行失败")
                         tool_results.append({
                             "type": "tool_result",
                             "tool_use_id": tool_use_id,
-                            "content": "工具执行失败"
+                            "content": "工具执行失败",
+                            "is_error": True
                         })
             
             # 添加工具结果消息
@@ -400,12 +1686,10 @@ def query_with_mcp_tools(query, mcp_client, conversation_history=None):
                 print("\n🎯 Claude 最终回复:")
                 print("-" * 40)
                 
-                follow_up_stream = client.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=2000,
+                follow_up_stream = stream_claude(
+                    "follow_up",
                     messages=messages,
-                    tools=anthropic_tools,
-                    stream=True
+                    tools=anthropic_tools
                 )
                 
                 final_assistant_content = []
@@ -445,17 +1729,34 @@ def query_with_mcp_tools(query, mcp_client, conversation_history=None):
         import traceback
         traceback.print_exc()
         return None, conversation_history
+    finally:
+        if speculation:
+            prefetcher.finish(speculation, tool_calls)
 
 
-def run_interactive_mode(mcp_client):
-    """交互模式 - 支持多轮对话"""
+def run_interactive_mode(mcp_client, store=None, session_id=None, prefetcher=None):
+    """交互模式 - 支持多轮对话
+
+    传入 store 时每轮对话新增的消息会追加写入会话存储，可以用 'resume <id>'
+    恢复之前的会话；内存中只保留最近 HISTORY_WINDOW 条消息。
+    """
     print("\n" + "="*50)
-    print("🎌 进入多轮对话模式 - 输入 'quit' 退出，'clear' 清空对话历史")
+    print("🎌 进入多轮对话模式 - 输入 'quit' 退出，'clear' 清空对话历史，'stats' 查看延迟统计")
+    print("📄 'read <资源URI>' 读取服务器资源，例如 read anime://calendar/1")
+    if store:
+        print("💾 'sessions' 列出最近的会话，'resume <会话ID>' 恢复会话")
     print("="*50)
     
-    # 维护对话历史
+    # 维护对话历史（最近的窗口）
     conversation_history = []
     user_query_count = 0  # 单独跟踪用户真实查询次数
+    if store and session_id:
+        if store.get_session(session_id):
+            conversation_history = store.load_window(session_id, HISTORY_WINDOW)
+            print(f"📂 已恢复会话 {session_id} (载入 {len(conversation_history)} 条消息)")
+        else:
+            print(f"❌ 会话不存在: {session_id}，将开始新会话")
+            session_id = None
     
     while True:
         try:
@@ -463,15 +1764,56 @@ def run_interactive_mode(mcp_client):
             query = prompt("\n💬 请输入您的问题: ").strip()
             
             if query.lower() in ['quit', 'exit', '退出', 'q']:
+                if store and session_id:
+                    print(f"💾 会话已保存，下次可输入 'resume {session_id}' 继续")
                 print("👋 再见！")
                 break
             
             if query.lower() in ['clear', '清空', 'reset']:
                 conversation_history = []
                 user_query_count = 0  # 重置计数器
+                session_id = None  # 下一轮对话开始新会话
                 print("🧹 对话历史已清空")
                 continue
             
+            if query.lower() in ['stats', '统计']:
+                print("\n📊 各阶段延迟统计:")
+                get_tracer().print_report()
+                print("\n🧭 模型路由:")
+                model_routing.print_report()
+                if prefetcher:
+                    print("\n🔮 推测预取:")
+                    prefetcher.print_report()
+                if getattr(mcp_client, "cache", None):
+                    print("\n💾 工具结果缓存命中率:")
+                    mcp_client.cache.print_report()
+                continue
+            
+            if query.lower().startswith('read ') and hasattr(mcp_client, "read_resource"):
+                contents = mcp_client.read_resource(query.split(maxsplit=1)[1].strip())
+                for item in contents or []:
+                    text = item.get("text", "")
+                    print(f"📄 {item.get('uri')} ({item.get('mimeType', '')}, {len(text)} 字符)")
+                    print(escape(text[:2000]) + (" ..." if len(text) > 2000 else ""))
+                continue
+            
+            if store and query.lower() in ['sessions', '会话']:
+                for info in store.list_sessions():
+                    updated = time.strftime("%m-%d %H:%M", time.localtime(info["updated"]))
+                    print(f"  {info['id']}  {updated}  {info['message_count']:>4} 条  {info['title'] or ''}")
+                continue
+            
+            if store and query.lower().startswith('resume '):
+                target = query.split(maxsplit=1)[1].strip()
+                if not store.get_session(target):
+                    print(f"❌ 会话不存在: {target}")
+                    continue
+                session_id = target
+                conversation_history = store.load_window(session_id, HISTORY_WINDOW)
+                user_query_count = 0
+                print(f"📂 已恢复会话 {session_id} (载入 {len(conversation_history)} 条消息)")
+                continue
+            
             if not query:
                 continue
             
@@ -482,10 +1824,20 @@ def run_interactive_mode(mcp_client):
             print(f"\n🔄 第 {user_query_count} 轮对话 (历史消息: {len(conversation_history)} 条)")
             
             # 进行查询并更新对话历史
-            success, conversation_history = query_with_mcp_tools(query, mcp_client, conversation_history)
+            previous_count = len(conversation_history)
+            success, conversation_history = query_with_mcp_tools(
+                query, mcp_client, conversation_history, prefetcher=prefetcher
+            )
             
             if success is None:
                 print("⚠️ 本轮对话失败，但对话历史已保留")
+            elif store:
+                if session_id is None:
+                    session_id = store.create_session()
+                    print(f"🆕 新会话 {session_id}")
+                # 只追加本轮新增的消息
+                store.append(session_id, conversation_history[previous_count:])
+            conversation_history = trim_window(conversation_history, HISTORY_WINDOW)
             
         except KeyboardInterrupt:
             print("\n👋 再见！")
@@ -493,7 +1845,7 @@ def run_interactive_mode(mcp_client):
         except Exception as e:
             print(f"❌ 处理输入时出错: {e}")
 
-def run_test_queries(mcp_client):
+def run_test_queries(mcp_client, prefetcher=None):
     """运行预设的测试查询"""
     test_queries = [
         "请帮我查询这周的动漫播放安排，我想看看星期五有什么好看的番剧。",
@@ -512,7 +1864,7 @@ def run_test_queries(mcp_client):
         print(f"🧪 测试查询 {i}/{len(test_queries)}")
         print(f"{'='*30}")
         
-        query_with_mcp_tools(query, mcp_client)
+        query_with_mcp_tools(query, mcp_client, prefetcher=prefetcher)
         
         if i < len(test_queries):
             print("\n⏳ 等待 3 秒后继续下一个测试...")
@@ -520,6 +1872,8 @@ def run_test_queries(mcp_client):
 
 def main():
     """主函数"""
+    configure_logging()
+    configure_tracing("mcp_client")
     print("🚀 启动 MCP + Anthropic API 集成客户端")
     print("="*50)
     
@@ -528,30 +1882,30 @@ def main():
         print("❌ 未找到 ANTHROPIC_API_KEY，请设置环境变量")
         return
     
-    # 初始化 MCP 客户端
-    mcp_client = MCPStdioClient(
-        server_script_path="mcp_server.py",
-        cwd="/Users/vsentkb/PycharmProjects/MCP"
-    )
+    # 初始化 MCP 客户端：本地服务器各自启动一个进程，设置了 MCP_SERVER_URL 时额外连接远程服务器
+    clients = {
+        name: MCPStdioClient(
+            server_script_path=script,
+            cwd="/Users/vsentkb/PycharmProjects/MCP"
+        )
+        for name, script in MCP_SERVERS.items()
+    }
+    server_url = os.environ.get("MCP_SERVER_URL")
+    if server_url:
+        clients["remote"] = MCPHttpClient(
+            url=server_url,
+            transport=os.environ.get("MCP_TRANSPORT", "streamable-http")
+        )
+    mcp_client = MCPToolRouter(clients)
+    prefetcher = None
+    store = None
     
     try:
-        # 启动服务器
+        # 并行启动并初始化所有服务器
         if not mcp_client.start_server():
+            print("❌ 没有可用的 MCP 服务器")
             return
         
-        # 等待服务器启动
-        print("⏳ 等待服务器启动...")
-        time.sleep(2)
-        
-        # 初始化连接
-        if not mcp_client.initialize():
-            print("❌ 初始化失败，输出调试信息:")
-            mcp_client.debug_info()
-            return
-        
-        # 等待初始化完成
-        time.sleep(1)
-        
         # 获取工具列表
         tools = mcp_client.list_tools()
         
@@ -570,16 +1924,23 @@ def main():
         
         choice = input("请输入选择 (1/2/3): ").strip()
         
+        if choice in ("2", "3"):
+            # 交互模式的对话写入会话存储，设置 MCP_SESSION_ID 可直接恢复之前的会话
+            store = ConversationStore()
+            session_id = os.environ.get("MCP_SESSION_ID")
+        # MCP_PREFETCH=1 时在模型生成回复期间推测性地预取只读工具
+        if os.environ.get("MCP_PREFETCH") == "1":
+            prefetcher = SpeculativePrefetcher(mcp_client)
         if choice == "1":
-            run_test_queries(mcp_client)
+            run_test_queries(mcp_client, prefetcher)
         elif choice == "2":
-            run_interactive_mode(mcp_client)
+            run_interactive_mode(mcp_client, store, session_id, prefetcher)
         elif choice == "3":
-            run_test_queries(mcp_client)
-            run_interactive_mode(mcp_client)
+            run_test_queries(mcp_client, prefetcher)
+            run_interactive_mode(mcp_client, store, session_id, prefetcher)
         else:
             print("❌ 无效选择，默认运行测试查询")
-            run_test_queries(mcp_client)
+            run_test_queries(mcp_client, prefetcher)
         
     except KeyboardInterrupt:
         print("\n⏹️ 用户中断")
@@ -589,7 +1950,17 @@ def main():
         traceback.print_exc()
         mcp_client.debug_info()
     finally:
+        if prefetcher:
+            prefetcher.close()
         mcp_client.stop_server()
+        if store:
+            store.close()
+        print("\n📊 各阶段延迟统计:")
+        get_tracer().print_report()
+        if prefetcher:
+            print("\n🔮 推测预取:")
+            prefetcher.print_report()
+        get_tracer().shutdown()
         print("\n🏁 程序结束")
 
 if __name__ == "__main__":
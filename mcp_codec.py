@@ -0,0 +1,76 @@
+import json
+import os
+
+
+class Codec:
+    """JSON 编解码器：dumps 返回 bytes，loads 接受 bytes / str"""
+
+    def __init__(self, name, dumps, loads, decode_error):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.DecodeError = decode_error
+
+    def __repr__(self):
+        return f"Codec({self.name!r})"
+
+
+def _stdlib_codec():
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return Codec("json", dumps, json.loads, json.JSONDecodeError)
+
+
+def _orjson_codec():
+    import orjson
+
+    return Codec("orjson", orjson.dumps, orjson.loads, orjson.JSONDecodeError)
+
+
+def _msgspec_codec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return Codec("msgspec", encoder.encode, decoder.decode, msgspec.DecodeError)
+
+
+# 按优先级排列，可选依赖缺失时自动跳过
+CODEC_FACTORIES = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "json": _stdlib_codec,
+}
+
+
+def available_codecs():
+    """返回当前环境可用的编解码器名称列表"""
+    names = []
+    for name, factory in CODEC_FACTORIES.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_codec(name=None):
+    """获取编解码器
+
+    name 为空时读取环境变量 MCP_JSON_CODEC，仍为空则按 orjson > msgspec > json
+    的顺序选择第一个可用的实现。
+    """
+    name = name or os.environ.get("MCP_JSON_CODEC")
+    if name:
+        if name not in CODEC_FACTORIES:
+            raise ValueError(f"未知的编解码器: {name}，可选: {list(CODEC_FACTORIES)}")
+        return CODEC_FACTORIES[name]()
+
+    for factory in CODEC_FACTORIES.values():
+        try:
+            return factory()
+        except ImportError:
+            continue
+    return _stdlib_codec()
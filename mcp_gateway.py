@@ -0,0 +1,347 @@
+"""多会话网关
+
+一个进程内同时服务多个独立对话：所有会话共用一组已经启动好的 MCP 服务器
+（MCPToolRouter）和一个 AsyncAnthropic 客户端（共享 httpx 连接池）。
+
+- 同一会话的轮次按到达顺序串行执行，排队数超过 max_queued_per_session 时直接拒绝；
+- 全局最多 max_concurrency 个轮次同时执行，每个会话同一时刻最多占用一个名额，
+  而等待名额的轮次按 FIFO 获得空位，因此活跃会话之间轮流执行，不会被单个会话占满；
+- 同步的 MCP 工具调用放在专用线程池中执行，同一轮的多个工具调用并行进行；
+  模型拿到工具结果后继续请求工具时接着调用，每轮最多 max_tool_rounds 次；
+- 每轮结束后会话历史按 history_window 截断（与交互模式相同的 trim_window），
+  长会话的内存、token 用量和单轮延迟不会随轮次无限增长。
+
+用法:
+    python mcp_gateway.py --port 8080
+    curl -X POST localhost:8080/sessions/alice/turns -d '{"query": "今天有什么番剧？"}'
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+import httpx
+
+from mcp_client import MCP_SERVERS, MCPStdioClient, MCPToolRouter, create_anthropic_tools_from_mcp
+from mcp_logging import configure_logging, get_logger
+from mcp_routing import ModelRoutingPolicy
+from mcp_store import DEFAULT_WINDOW as HISTORY_WINDOW, trim_window
+from mcp_tracing import Histogram, configure_tracing, get_tracer
+
+logger = get_logger("mcp_gateway")
+
+
+class SessionBusy(Exception):
+    """会话排队的轮次过多"""
+
+
+class GatewaySession:
+    """单个对话的状态"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.history = []
+        self.lock = asyncio.Lock()
+        self.queued = 0
+        self.turns = 0
+        self.last_active = time.monotonic()
+
+
+class MCPGateway:
+    """在一组共享的 MCP 服务器上并发处理多个会话"""
+
+    def __init__(self, mcp_client, max_concurrency=32, pool_size=64, max_queued_per_session=4,
+                 session_ttl=1800, routing=None, max_tool_rounds=4, history_window=HISTORY_WINDOW):
+        self.mcp_client = mcp_client
+        # 各阶段的模型和 max_tokens，默认读取 MCP_MODEL_ROUTES
+        self.routing = routing or ModelRoutingPolicy.from_env()
+        self.max_concurrency = max_concurrency
+        self.max_queued_per_session = max_queued_per_session
+        self.session_ttl = session_ttl
+        self.max_tool_rounds = max_tool_rounds
+        self.history_window = history_window
+
+        # 所有会话共用一个连接池，保持与 API 的 keep-alive 连接
+        self.http_client = anthropic.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+        self.anthropic = anthropic.AsyncAnthropic(http_client=self.http_client)
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="mcp-tool")
+
+        self.sessions = {}
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.turn_latency = Histogram()
+        self._tools_source = None
+        self._anthropic_tools = []
+
+    def session(self, session_id):
+        """获取会话，不存在时创建（同时清理长时间不活跃的会话）"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            self._evict_idle()
+            session = self.sessions[session_id] = GatewaySession(session_id)
+        return session
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.session_ttl
+        for session_id, session in list(self.sessions.items()):
+            if session.last_active < deadline and not session.queued:
+                del self.sessions[session_id]
+
+    def close_session(self, session_id):
+        return self.sessions.pop(session_id, None) is not None
+
+    async def run_turn(self, session_id, query):
+        """执行一轮对话，返回 Claude 的最终文本回复"""
+        session = self.session(session_id)
+        if session.queued >= self.max_queued_per_session:
+            self.rejected += 1
+            raise SessionBusy(f"会话 {session_id} 已有 {session.queued} 个轮次在排队")
+
+        session.queued += 1
+        started = time.perf_counter()
+        try:
+            # 先在会话内排队，再争抢全局名额：每个会话最多只有一个轮次在等待全局名额
+            async with session.lock:
+                async with self.slots:
+                    self.active += 1
+                    try:
+                        with get_tracer().start_span("gateway.turn", {"session.id": session_id}):
+                            reply, messages = await self._turn(session.history, query)
+                    finally:
+                        self.active -= 1
+                session.history = trim_window(messages, self.history_window)
+                session.turns += 1
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            session.queued -= 1
+            session.last_active = time.monotonic()
+
+        self.turn_latency.record((time.perf_counter() - started) * 1000)
+        self.completed += 1
+        return reply
+
+    async def _turn(self, history, query):
+        tools = await self._tools()
+        messages = history + [{"role": "user", "content": query}]
+
+        content = await self._stream("stream", messages, tools)
+        for _ in range(self.max_tool_rounds):
+            tool_uses = [block for block in content if block["type"] == "tool_use"]
+            if not tool_uses:
+                break
+            messages.append({"role": "assistant", "content": content})
+            # 同一轮的多个工具调用并行执行
+            tool_results = await asyncio.gather(*(self._call_tool(block) for block in tool_uses))
+            messages.append({"role": "user", "content": list(tool_results)})
+            content = await self._stream("follow_up", messages, tools)
+        else:
+            # 达到轮数上限：没有 tool_result 的 tool_use 不能留在历史中，否则之后的请求都会被 API 拒绝
+            if any(block["type"] == "tool_use" for block in content):
+                logger.warning("⚠️ 工具调用超过 %s 轮，丢弃未执行的工具调用", self.max_tool_rounds)
+                content = [block for block in content if block["type"] == "text"] \
+                    or [{"type": "text", "text": "（工具调用次数已达上限）"}]
+        messages.append({"role": "assistant", "content": content})
+        return _text_of(content), messages
+
+    async def _tools(self):
+        """转换后的工具列表，只在 MCP 工具列表变化后重新转换"""
+        mcp_tools = await self._in_thread(lambda: self.mcp_client.tools)
+        if mcp_tools is not self._tools_source:
+            self._anthropic_tools = create_anthropic_tools_from_mcp(mcp_tools)
+            self._tools_source = mcp_tools
+        return self._anthropic_tools
+
+    async def _stream(self, stage, messages, tools):
+        """流式调用 Claude 并组装出内容块列表，记录首 token 时间"""
+        tracer = get_tracer()
+        blocks = []
+        current = None
+        route = self.routing.route(stage)
+        ttft_ms = None
+        usage = {}
+        with tracer.start_span(f"claude.{stage}", dict(route)) as span:
+            started = time.perf_counter()
+            stream = await self.anthropic.messages.create(
+                **route,
+                messages=messages,
+                tools=tools,
+                stream=True
+            )
+            async with stream:
+                async for event in stream:
+                    if event.type == "content_block_start":
+                        block = event.content_block
+                        if block.type == "tool_use":
+                            current = {"type": "tool_use", "id": block.id, "name": block.name, "input_json": ""}
+                        else:
+                            current = {"type": "text", "text": ""}
+                    elif event.type == "content_block_delta":
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - started) * 1000
+                            tracer.record(f"claude.{stage}.ttft", ttft_ms)
+                            span.set_attribute("ttft_ms", round(ttft_ms, 1))
+                        if event.delta.type == "text_delta":
+                            current["text"] += event.delta.text
+                        elif event.delta.type == "input_json_delta":
+                            current["input_json"] += event.delta.partial_json
+                    elif event.type == "content_block_stop" and current:
+                        if current["type"] == "tool_use":
+                            raw = current.pop("input_json")
+                            current["input"] = json.loads(raw) if raw else {}
+                            blocks.append(current)
+                        elif current["text"]:
+                            blocks.append(current)
+                        current = None
+                    elif event.type == "message_start" and event.message.usage:
+                        usage["input_tokens"] = event.message.usage.input_tokens
+                    elif event.type == "message_delta" and event.usage:
+                        usage["output_tokens"] = event.usage.output_tokens
+                    elif event.type == "message_stop":
+                        break
+        self.routing.record(stage, route["model"], route["max_tokens"], ttft_ms,
+                            (time.perf_counter() - started) * 1000, **usage)
+        return blocks
+
+    async def _call_tool(self, block):
+        with get_tracer().start_span("tool_call", {"tool.name": block["name"]}):
+            result = await self._in_thread(self.mcp_client.call_tool, block["name"], block["input"])
+        return {
+            "type": "tool_result",
+            "tool_use_id": block["id"],
+            "content": json.dumps(result, ensure_ascii=False) if result else "工具执行失败",
+            "is_error": not result or bool(result.get("isError"))
+        }
+
+    async def _in_thread(self, fn, *args):
+        """在工具线程池中执行同步调用，并带上当前 trace 上下文"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, fn, *args)
+        )
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "active_turns": self.active,
+            "max_concurrency": self.max_concurrency,
+            "completed_turns": self.completed,
+            "failed_turns": self.failed,
+            "rejected_turns": self.rejected,
+            "turn_latency": self.turn_latency.summary(),
+            "model_routes": self.routing.report(),
+        }
+
+    async def aclose(self):
+        await self.anthropic.close()
+        self.executor.shutdown(wait=False)
+
+
+def _text_of(content):
+    return "".join(block["text"] for block in content if block["type"] == "text")
+
+
+def create_app(gateway):
+    """网关的 HTTP 接口"""
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def post_turn(request):
+        session_id = request.path_params["session_id"]
+        try:
+            body = await request.json()
+        except ValueError:
+            return JSONResponse({"error": "请求体不是合法的 JSON"}, status_code=400)
+        query = body.get("query") if isinstance(body, dict) else None
+        if not query:
+            return JSONResponse({"error": "缺少 query"}, status_code=400)
+
+        started = time.perf_counter()
+        try:
+            reply = await gateway.run_turn(session_id, query)
+        except SessionBusy as e:
+            return JSONResponse({"error": str(e)}, status_code=429)
+        except Exception as e:
+            logger.exception("会话 %s 的轮次失败", session_id)
+            return JSONResponse({"error": str(e)}, status_code=502)
+        return JSONResponse({
+            "session_id": session_id,
+            "reply": reply,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    async def delete_session(request):
+        if gateway.close_session(request.path_params["session_id"]):
+            return JSONResponse({"deleted": True})
+        return JSONResponse({"error": "会话不存在"}, status_code=404)
+
+    async def get_stats(request):
+        return JSONResponse(gateway.stats())
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        await gateway.aclose()
+
+    return Starlette(routes=[
+        Route("/sessions/{session_id}/turns", post_turn, methods=["POST"]),
+        Route("/sessions/{session_id}", delete_session, methods=["DELETE"]),
+        Route("/stats", get_stats, methods=["GET"]),
+    ], lifespan=lifespan)
+
+
+def create_router(cwd=None):
+    """启动网关共用的本地 MCP 服务器"""
+    cwd = cwd or os.environ.get("MCP_SERVER_CWD") or os.path.dirname(os.path.abspath(__file__))
+    return MCPToolRouter({
+        name: MCPStdioClient(script, cwd=cwd, max_in_flight=64)
+        for name, script in MCP_SERVERS.items()
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP 多会话网关")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=32, help="同时执行的轮次上限")
+    parser.add_argument("--pool-size", type=int, default=64, help="Anthropic API 连接池大小")
+    parser.add_argument("--max-queued-per-session", type=int, default=4, help="单个会话允许排队的轮次数")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    configure_logging()
+    configure_tracing("mcp_gateway")
+    router = create_router()
+    if not router.start_server():
+        print("❌ 没有可用的 MCP 服务器")
+        return
+    try:
+        gateway = MCPGateway(
+            router,
+            max_concurrency=args.max_concurrency,
+            pool_size=args.pool_size,
+            max_queued_per_session=args.max_queued_per_session,
+        )
+        print(f"🚀 网关已启动: http://{args.host}:{args.port}")
+        uvicorn.run(create_app(gateway), host=args.host, port=args.port, log_level="warning")
+    finally:
+        router.stop_server()
+        get_tracer().shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s | %(message)s"
+
+# 常见非 JSON 日志格式中位于行首的级别字段：
+#   "ERROR:root:..."（logging 默认）、"INFO:     ..."（uvicorn）、
+#   "[06/14/25 10:00:00] WARNING  ..."（rich）、"2025-06-14 10:00:00,123 ERROR ..."
+_LEVEL_PATTERN = re.compile(
+    r"^(?:\[[^\]]*\]\s*|\d{4}-\d{2}-\d{2}[ T][\d:.,]+\s+)?"
+    r"(DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL|FATAL)\b[:\s]*(.*)$"
+)
+_LEVEL_ALIASES = {"WARN": "WARNING", "FATAL": "CRITICAL"}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行 JSON，附带通过 extra 传入的结构化字段"""
+
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def get_logger(name):
+    """获取日志记录器，请使用 %s 占位符以便延迟格式化"""
+    return logging.getLogger(name)
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """配置根日志记录器
+
+    level 默认读取 MCP_LOG_LEVEL（INFO），fmt 默认读取 MCP_LOG_FORMAT
+    （text 或 json）。
+    """
+    level = level or os.environ.get("MCP_LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("MCP_LOG_FORMAT", "text")
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def configure_server_logging(level=None):
+    """MCP 服务器端日志：stderr 上每行一条 JSON 记录，便于客户端解析
+
+    FastMCP 在导入时会给 "FastMCP" 记录器挂上 RichHandler，这里移除它并
+    交由根记录器统一输出。warnings 模块的警告（如依赖的弃用警告）也转为
+    py.warnings 记录器的 WARNING 记录，不会以无法识别级别的原始文本出现在 stderr，
+    被客户端当作错误输出。在导入 fastmcp 之前调用一次即可覆盖导入期间的警告。
+    """
+    configure_logging(level=level, fmt="json", stream=sys.stderr)
+    logging.captureWarnings(True)
+    fastmcp_logger = logging.getLogger("FastMCP")
+    for existing in fastmcp_logger.handlers[:]:
+        fastmcp_logger.removeHandler(existing)
+    fastmcp_logger.propagate = True
+
+
+def parse_log_record(line):
+    """把服务器 stderr 的一行解析为日志记录
+
+    返回 {"level": ..., "msg": ..., ...}；无法识别级别时 level 为 None
+    （例如 traceback 的后续行）。
+    """
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict) and "level" in record:
+            record["level"] = _LEVEL_ALIASES.get(record["level"], record["level"])
+            return record
+
+    match = _LEVEL_PATTERN.match(line)
+    if match:
+        level = match.group(1)
+        return {"level": _LEVEL_ALIASES.get(level, level), "msg": match.group(2)}
+    return {"level": None, "msg": line}
+
+
+class PayloadSampler:
+    """负载日志采样：每 every 条记录一次，并截断到 max_chars
+
+    默认读取 MCP_LOG_PAYLOAD_EVERY（1）和 MCP_LOG_PAYLOAD_MAX_CHARS（2000）。
+    调用方应先检查 logger.isEnabledFor(DEBUG)，避免在关闭时做任何格式化。
+    """
+
+    def __init__(self, every=None, max_chars=None):
+        self.every = max(1, int(every or os.environ.get("MCP_LOG_PAYLOAD_EVERY", 1)))
+        self.max_chars = int(max_chars or os.environ.get("MCP_LOG_PAYLOAD_MAX_CHARS", 2000))
+        self._count = 0
+
+    def should_log(self):
+        self._count += 1
+        return self._count % self.every == 0
+
+    def render(self, payload):
+        """延迟渲染：只有真正输出时才会被 %s 调用"""
+        return _Truncated(payload, self.max_chars)
+
+
+class _Truncated:
+    __slots__ = ("payload", "max_chars")
+
+    def __init__(self, payload, max_chars):
+        self.payload = payload
+        self.max_chars = max_chars
+
+    def __str__(self):
+        if isinstance(self.payload, bytes):
+            text = self.payload.decode("utf-8", "replace").rstrip()
+        elif isinstance(self.payload, str):
+            text = self.payload.rstrip()
+        else:
+            text = json.dumps(self.payload, ensure_ascii=False, default=str)
+        if len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}...(+{len(text) - self.max_chars} chars)"
+        return text
+
+
+def elapsed_ms(start):
+    """从 time.perf_counter() 起点计算毫秒数"""
+    return round((time.perf_counter() - start) * 1000, 2)
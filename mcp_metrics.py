@@ -0,0 +1,260 @@
+import functools
+import inspect
+import threading
+import time
+
+from mcp_tracing import Histogram
+
+# Prometheus 直方图的默认桶边界（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        return {",".join(f"{k}={v}" for k, v in key) or "total": value for key, value in self.values.items()}
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def render(self):
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """可增可减的瞬时值（如进行中的请求数）"""
+
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+
+class LatencyHistogram(_Metric):
+    """延迟直方图，内部复用 mcp_tracing.Histogram，按毫秒记录、按秒导出"""
+
+    kind = "histogram"
+
+    def observe(self, value_ms, **labels):
+        key = _label_key(labels)
+        histogram = self.values.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.values.setdefault(key, Histogram())
+        histogram.record(value_ms)
+
+    def snapshot(self):
+        return {label: histogram.summary() for label, histogram in super().snapshot().items()}
+
+    def render(self):
+        lines = []
+        for key, histogram in self.values.items():
+            with histogram._lock:
+                buckets = sorted(histogram.buckets.items())
+                count, total = histogram.count, histogram.total
+            # 子桶以下界为键，覆盖 [lower, lower + 2^shift)；只有整个子桶都不超过 le 才计入，
+            # 否则 le 会多算上方最多一个子桶宽度的值。跨越 le 的子桶整体算到下一个桶，
+            # 因此 le 附近相对误差 2^-(precision-1) 以内的值可能被少计（只会偏保守，不会多计）
+            uppers = [
+                (lower + (1 << max(0, lower.bit_length() - histogram.precision)) - 1, n)
+                for lower, n in buckets
+            ]
+            for bound in DEFAULT_BUCKETS:
+                limit_us = bound * 1_000_000
+                cumulative = sum(n for upper, n in uppers if upper <= limit_us)
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total / 1_000_000}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.setdefault(name, cls(name, help_text))
+        return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text=""):
+        return self._get(LatencyHistogram, name, help_text)
+
+    def snapshot(self):
+        """JSON 友好的指标快照，附带按缓存计算的命中率"""
+        result = {"uptime_seconds": round(time.time() - self.started, 1)}
+        for name, metric in sorted(self.metrics.items()):
+            result[name] = metric.snapshot()
+
+        hits = self.metrics.get("mcp_cache_hits_total")
+        misses = self.metrics.get("mcp_cache_misses_total")
+        if hits or misses:
+            ratios = {}
+            for key in set(hits.values if hits else {}) | set(misses.values if misses else {}):
+                hit = hits.values.get(key, 0) if hits else 0
+                miss = misses.values.get(key, 0) if misses else 0
+                ratios[",".join(f"{k}={v}" for k, v in key)] = round(hit / (hit + miss), 4) if hit + miss else None
+            result["mcp_cache_hit_ratio"] = ratios
+        return result
+
+    def render_prometheus(self):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = [
+            "# HELP process_uptime_seconds Seconds since the metrics registry was created.",
+            "# TYPE process_uptime_seconds gauge",
+            f"process_uptime_seconds {time.time() - self.started:.1f}",
+        ]
+        for name, metric in sorted(self.metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+tool_calls = registry.counter("mcp_tool_calls_total", "Tool invocations.")
+tool_errors = registry.counter("mcp_tool_errors_total", "Tool invocations that returned an error, by error_code.")
+tool_latency = registry.histogram("mcp_tool_duration_seconds", "Tool execution latency.")
+tool_in_flight = registry.gauge("mcp_tool_in_flight", "Tool invocations currently executing.")
+upstream_latency = registry.histogram("mcp_upstream_duration_seconds", "Upstream (bgm.tv / EC2) call latency.")
+cache_hits = registry.counter("mcp_cache_hits_total", "Cache hits.")
+cache_misses = registry.counter("mcp_cache_misses_total", "Cache misses.")
+
+
+def error_code_of(result):
+    """从工具返回值中提取错误码：dict 取 error 字段，字符串以 ❌ 开头视为上游错误"""
+    if isinstance(result, dict) and result.get("success") is False:
+        return str(result.get("error", "unknown"))
+    if isinstance(result, str) and result.startswith("❌"):
+        return "upstream_error"
+    return None
+
+
+def instrumented_tool(fn):
+    """MCP 工具装饰器：记录调用次数、延迟、进行中数量和按 error_code 分类的错误
+
+    与 traced_tool 一样通过 functools.wraps 保留签名，需放在 @mcp.tool() 之下。
+    """
+    tool = fn.__name__
+
+    def finish(started, result=None, exc=None):
+        tool_latency.observe((time.perf_counter() - started) * 1000, tool=tool)
+        tool_in_flight.dec(tool=tool)
+        code = type(exc).__name__ if exc is not None else error_code_of(result)
+        if code:
+            tool_errors.inc(tool=tool, error_code=code)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            tool_calls.inc(tool=tool)
+            tool_in_flight.inc(tool=tool)
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                finish(started, exc=e)
+                raise
+            finish(started, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        tool_calls.inc(tool=tool)
+        tool_in_flight.inc(tool=tool)
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            finish(started, exc=e)
+            raise
+        finish(started, result)
+        return result
+    return wrapper
+
+
+class timed_upstream:
+    """上下文管理器：记录一次上游调用的耗时"""
+
+    def __init__(self, upstream, operation):
+        self.labels = {"upstream": upstream, "operation": operation}
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        upstream_latency.observe((time.perf_counter() - self.started) * 1000, **self.labels)
+        return False
+
+
+def register_metrics(mcp):
+    """为 FastMCP 服务器注册 server_metrics 工具和 HTTP 模式下的 /metrics 端点"""
+
+    @mcp.tool(annotations={"readOnlyHint": True, "idempotentHint": True, "cacheTtlSeconds": 0})
+    def server_metrics() -> dict:
+        """获取 MCP 服务器运行指标
+
+        返回各工具的调用次数、延迟分布、按错误码统计的错误数、进行中的请求数、
+        上游调用延迟以及缓存命中率。
+        """
+        return registry.snapshot()
+
+    @mcp.custom_route("/metrics", methods=["GET"], include_in_schema=False)
+    async def prometheus_metrics(request):
+        from starlette.responses import PlainTextResponse
+
+        return PlainTextResponse(registry.render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,32 @@
+from mcp_logging import get_logger
+
+logger = get_logger("mcp_progress")
+
+
+async def report_progress(ctx, progress, total=None, message=None):
+    """向客户端发送 notifications/progress，message 只是简短的进度说明，不携带结果内容
+
+    与 Context.report_progress 相同，只有请求 _meta 中带 progressToken 时才会发送；
+    额外带上 related_request_id，streamable-http 下通知会写入该请求自己的响应流，
+    而不是客户端可能没有打开的独立 GET 流。
+    """
+    if ctx is None:
+        return
+    try:
+        request_context = ctx.request_context
+    except ValueError:
+        return  # 不在 MCP 请求上下文中（例如直接调用工具函数）
+    token = request_context.meta.progressToken if request_context.meta else None
+    if token is None:
+        return
+    try:
+        await request_context.session.send_progress_notification(
+            progress_token=token,
+            progress=progress,
+            total=total,
+            message=message,
+            related_request_id=request_context.request_id,
+        )
+    except Exception as e:
+        # 进度通知只是提示，发送失败不影响工具结果
+        logger.warning("发送进度通知失败: %s", e)
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+
+from mcp_logging import get_logger
+from mcp_tracing import get_tracer
+
+logger = get_logger("mcp_routing")
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
+DEFAULT_MAX_TOKENS = 2000
+
+# 对话阶段，与 span 名 claude.<阶段> 一致：
+#   stream    - 第一次调用：选择工具并填写参数（不需要工具时直接给出回复）
+#   follow_up - 拿到工具结果后生成最终回复
+STAGES = ("stream", "follow_up")
+
+
+class ModelRoutingPolicy:
+    """按对话阶段选择模型和 max_tokens
+
+    routes 形如::
+
+        {"stream": {"model": "claude-3-5-haiku-20241022", "max_tokens": 512},
+         "follow_up": {"model": "claude-3-5-sonnet-20241022", "max_tokens": 2000}}
+
+    可以再加一个 "default" 项，未配置的阶段都使用它。每次调用结束后记录路由决策、
+    首 token 时间和 token 用量；首 token 时间按 (阶段, 模型) 记录在
+    route.<阶段>.<模型>.ttft 直方图中，会随 tracer 报告一起出现在基准测试结果里。
+    """
+
+    def __init__(self, routes=None):
+        routes = dict(routes or {})
+        self.default = {"model": DEFAULT_MODEL, "max_tokens": DEFAULT_MAX_TOKENS, **routes.pop("default", {})}
+        self.routes = {stage: {**self.default, **route} for stage, route in routes.items()}
+        self.usage = {}  # (阶段, 模型) -> 调用次数与 token 用量
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """读取 MCP_MODEL_ROUTES（JSON 字符串或 JSON 文件路径），未设置时所有阶段使用默认模型"""
+        config = os.environ.get("MCP_MODEL_ROUTES")
+        if not config:
+            return cls()
+        if os.path.isfile(config):
+            with open(config, encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls(json.loads(config))
+
+    def route(self, stage):
+        """该阶段使用的 {"model", "max_tokens"}"""
+        return dict(self.routes.get(stage, self.default))
+
+    def record(self, stage, model, max_tokens, ttft_ms, duration_ms, input_tokens=None, output_tokens=None):
+        """记录一次路由决策及其实测延迟和用量"""
+        if ttft_ms is not None:
+            get_tracer().record(f"route.{stage}.{model}.ttft", ttft_ms)
+        with self._lock:
+            usage = self.usage.setdefault(
+                (stage, model), {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+            )
+            usage["calls"] += 1
+            usage["input_tokens"] += input_tokens or 0
+            usage["output_tokens"] += output_tokens or 0
+        logger.info(
+            "🧭 模型路由: stage=%s model=%s max_tokens=%s ttft_ms=%s duration_ms=%.1f tokens=%s/%s",
+            stage, model, max_tokens, None if ttft_ms is None else round(ttft_ms, 1),
+            duration_ms, input_tokens, output_tokens
+        )
+
+    def report(self):
+        """各 (阶段, 模型) 的调用次数、token 用量和首 token 时间分布"""
+        tracer = get_tracer()
+        with self._lock:
+            usage = {key: dict(value) for key, value in sorted(self.usage.items())}
+        report = {}
+        for (stage, model), value in usage.items():
+            ttft = tracer.histograms.get(f"route.{stage}.{model}.ttft")
+            report[f"{stage}/{model}"] = {**value, "ttft": ttft.summary() if ttft else {}}
+        return report
+
+    def print_report(self):
+        report = self.report()
+        if not report:
+            print("（暂无模型调用）")
+            return
+        print(f"{'stage/model':<44}{'calls':>7}{'in tok':>9}{'out tok':>9}{'ttft p50':>10}{'ttft p99':>10}")
+        for name, s in report.items():
+            ttft = s["ttft"]
+            print(f"{name:<44}{s['calls']:>7}{s['input_tokens']:>9}{s['output_tokens']:>9}"
+                  f"{ttft.get('p50_ms') or 0:>10.1f}{ttft.get('p99_ms') or 0:>10.1f}")
@@ -0,0 +1,299 @@
+"""工具参数的 JSON Schema 校验
+
+把 tools/list 返回的 inputSchema 预先编译成由闭包组成的校验函数：关键字只在编译时
+解析一次（$ref 解析、正则编译、enum 整理），校验时只执行与该 schema 相关的检查。
+支持 MCP 工具 schema 中常见的关键字：type、enum、const、$ref/$defs、anyOf/oneOf/allOf、
+properties/required/additionalProperties、items/minItems/maxItems、
+minLength/maxLength/pattern、minimum/maximum/exclusiveMinimum/exclusiveMaximum/multipleOf。
+其余关键字（format、title、description 等）忽略。
+"""
+import json
+import re
+
+_JSON_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def _type_name(value):
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, dict):
+        return "object"
+    return type(value).__name__
+
+
+def _equal(a, b):
+    """JSON 语义的相等：true 不等于 1"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    return a == b
+
+
+def _show(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _join(path, key):
+    if isinstance(key, int):
+        return f"{path}[{key}]"
+    return f"{path}.{key}" if path else key
+
+
+class _Compiler:
+    def __init__(self, root):
+        self.root = root
+        self.refs = {}
+
+    def ref(self, ref):
+        if ref in self.refs:
+            # 递归引用：运行时再取编译结果
+            refs = self.refs
+            return lambda value, path, errors: refs[ref] and refs[ref](value, path, errors)
+        if not ref.startswith("#"):
+            return None  # 不支持外部引用，忽略
+        node = self.root
+        for part in filter(None, ref[1:].split("/")):
+            node = node[part.replace("~1", "/").replace("~0", "~")]
+        self.refs[ref] = None
+        check = self.compile(node)
+        self.refs[ref] = check
+        return check
+
+    def compile(self, schema):
+        if schema is True or schema == {}:
+            return None
+        if schema is False:
+            return lambda value, path, errors: errors.append(f"{path or '参数'}: 不允许出现")
+
+        checks = []
+        if "$ref" in schema:
+            check = self.ref(schema["$ref"])
+            if check:
+                checks.append(check)
+        if "type" in schema:
+            checks.append(self._type(schema["type"]))
+        if "enum" in schema:
+            checks.append(self._enum(schema["enum"]))
+        if "const" in schema:
+            checks.append(self._enum([schema["const"]]))
+        for keyword in ("anyOf", "oneOf", "allOf"):
+            if keyword in schema:
+                checks.append(self._combinator(keyword, schema[keyword]))
+        checks.extend(self._object(schema))
+        checks.extend(self._array(schema))
+        checks.extend(self._string(schema))
+        checks.extend(self._number(schema))
+
+        checks = [check for check in checks if check]
+        if not checks:
+            return None
+        if len(checks) == 1:
+            return checks[0]
+
+        def check_all(value, path, errors):
+            for check in checks:
+                check(value, path, errors)
+        return check_all
+
+    def _type(self, types):
+        names = [types] if isinstance(types, str) else list(types)
+        predicates = [_JSON_TYPES[name] for name in names if name in _JSON_TYPES]
+        expected = " 或 ".join(names)
+
+        def check(value, path, errors):
+            if not any(predicate(value) for predicate in predicates):
+                errors.append(f"{path or '参数'}: 应为 {expected}，实际为 {_type_name(value)} {_show(value)}")
+        return check
+
+    def _enum(self, options):
+        allowed = "、".join(_show(option) for option in options)
+
+        def check(value, path, errors):
+            if not any(_equal(value, option) for option in options):
+                errors.append(f"{path or '参数'}: {_show(value)} 不是允许的取值，可选值为 {allowed}")
+        return check
+
+    def _declared_types(self, schema):
+        """分支声明的类型（跟随 $ref），未声明时返回 None"""
+        while isinstance(schema, dict) and "type" not in schema and "$ref" in schema:
+            ref = schema["$ref"]
+            if not ref.startswith("#"):
+                return None
+            schema = self.root
+            for part in filter(None, ref[1:].split("/")):
+                schema = schema[part.replace("~1", "/").replace("~0", "~")]
+        if not isinstance(schema, dict) or "type" not in schema:
+            return None
+        types = schema["type"]
+        return [types] if isinstance(types, str) else list(types)
+
+    def _combinator(self, keyword, schemas):
+        branches = [self.compile(sub) for sub in schemas]
+        branch_types = [self._declared_types(sub) for sub in schemas]
+
+        def check(value, path, errors):
+            results = []
+            for branch in branches:
+                branch_errors = []
+                if branch:
+                    branch(value, path, branch_errors)
+                results.append(branch_errors)
+            passed = sum(1 for branch_errors in results if not branch_errors)
+            if keyword == "allOf":
+                for branch_errors in results:
+                    errors.extend(branch_errors)
+            elif keyword == "anyOf" and not passed:
+                # 只有一个分支与取值类型相符时直接给出该分支的错误，更便于修正
+                relevant = [
+                    branch_errors for branch_errors, types in zip(results, branch_types)
+                    if types is None or any(_JSON_TYPES[t](value) for t in types if t in _JSON_TYPES)
+                ]
+                if len(relevant) == 1:
+                    errors.extend(relevant[0])
+                else:
+                    errors.append(f"{path or '参数'}: 不符合任何一种允许的形式（"
+                                  + "；".join(e[0] for e in results if e) + "）")
+            elif keyword == "oneOf" and passed != 1:
+                errors.append(f"{path or '参数'}: 应恰好符合一种形式，实际符合 {passed} 种")
+        return check
+
+    def _object(self, schema):
+        properties = {name: self.compile(sub) for name, sub in schema.get("properties", {}).items()}
+        properties = {name: check for name, check in properties.items() if check}
+        required = list(schema.get("required", []))
+        additional = schema.get("additionalProperties", True)
+        additional_check = self.compile(additional) if isinstance(additional, dict) else None
+        known = set(schema.get("properties", {}))
+        if not (properties or required or additional is not True):
+            return []
+
+        def check(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    errors.append(f"{_join(path, name)}: 缺少必填参数")
+            for name, item in value.items():
+                property_check = properties.get(name)
+                if property_check:
+                    property_check(item, _join(path, name), errors)
+                elif name not in known:
+                    if additional is False:
+                        allowed = "、".join(sorted(known)) or "无"
+                        errors.append(f"{_join(path, name)}: 未知参数，允许的参数为 {allowed}")
+                    elif additional_check:
+                        additional_check(item, _join(path, name), errors)
+        return [check]
+
+    def _array(self, schema):
+        items = schema.get("items")
+        item_check = self.compile(items) if isinstance(items, dict) else None
+        tuple_checks = [self.compile(sub) for sub in items] if isinstance(items, list) else None
+        min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+        if item_check is None and tuple_checks is None and min_items is None and max_items is None:
+            return []
+
+        def check(value, path, errors):
+            if not isinstance(value, list):
+                return
+            if min_items is not None and len(value) < min_items:
+                errors.append(f"{path or '参数'}: 至少需要 {min_items} 项，实际 {len(value)} 项")
+            if max_items is not None and len(value) > max_items:
+                errors.append(f"{path or '参数'}: 最多 {max_items} 项，实际 {len(value)} 项")
+            if item_check:
+                for i, item in enumerate(value):
+                    item_check(item, _join(path, i), errors)
+            elif tuple_checks:
+                for i, (item, sub_check) in enumerate(zip(value, tuple_checks)):
+                    if sub_check:
+                        sub_check(item, _join(path, i), errors)
+        return [check]
+
+    def _string(self, schema):
+        min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+        pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+        if min_length is None and max_length is None and pattern is None:
+            return []
+
+        def check(value, path, errors):
+            if not isinstance(value, str):
+                return
+            if min_length is not None and len(value) < min_length:
+                errors.append(f"{path or '参数'}: 长度至少为 {min_length}")
+            if max_length is not None and len(value) > max_length:
+                errors.append(f"{path or '参数'}: 长度最多为 {max_length}")
+            if pattern and not pattern.search(value):
+                errors.append(f"{path or '参数'}: {_show(value)} 不匹配格式 {pattern.pattern}")
+        return [check]
+
+    def _number(self, schema):
+        bounds = [
+            (schema.get("minimum"), lambda v, b: v >= b, "应大于或等于"),
+            (schema.get("maximum"), lambda v, b: v <= b, "应小于或等于"),
+            (schema.get("exclusiveMinimum"), lambda v, b: v > b, "应大于"),
+            (schema.get("exclusiveMaximum"), lambda v, b: v < b, "应小于"),
+        ]
+        bounds = [(bound, ok, text) for bound, ok, text in bounds if isinstance(bound, (int, float))]
+        multiple_of = schema.get("multipleOf")
+        if not bounds and multiple_of is None:
+            return []
+
+        def check(value, path, errors):
+            if not _JSON_TYPES["number"](value):
+                return
+            for bound, ok, text in bounds:
+                if not ok(value, bound):
+                    errors.append(f"{path or '参数'}: {_show(value)} {text} {bound}")
+            if multiple_of and not _is_multiple(value, multiple_of):
+                errors.append(f"{path or '参数'}: {_show(value)} 应为 {multiple_of} 的倍数")
+        return [check]
+
+
+def _is_multiple(value, multiple_of):
+    """value 是否为 multipleOf 的倍数；浮点除法有舍入误差（如 0.3 / 0.1 = 2.9999999999999996），
+    商与最近整数的差在相对 1e-9 以内即视为整除"""
+    quotient = value / multiple_of
+    return abs(quotient - round(quotient)) <= 1e-9 * max(1, abs(quotient))
+
+
+def compile_schema(schema):
+    """把 JSON Schema 编译成校验函数，返回的函数接收参数值并返回错误信息列表（为空表示通过）"""
+    check = _Compiler(schema).compile(schema or {})
+
+    def validate(value):
+        errors = []
+        if check:
+            check(value, "", errors)
+        return errors
+    return validate
+
+
+class SchemaValidators:
+    """按 schema 内容缓存编译结果，工具列表刷新时未变化的 schema 不会重新编译"""
+
+    def __init__(self):
+        self._compiled = {}
+
+    def get(self, schema):
+        key = json.dumps(schema or {}, sort_keys=True, ensure_ascii=False, default=str)
+        validate = self._compiled.get(key)
+        if validate is None:
+            validate = self._compiled[key] = compile_schema(schema)
+        return validate
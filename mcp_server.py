@@ -1,10 +1,24 @@
-from fastmcp import FastMCP
+import asyncio
+import json
+import os
+import anyio
+from mcp_logging import configure_server_logging, get_logger
+# 在导入 fastmcp 之前接管日志，导入期间的警告（如 AuthlibDeprecationWarning）也输出为 JSON 记录
+configure_server_logging()
+from fastmcp import Context, FastMCP
+from mcp_tracing import configure_tracing, traced_tool
+from mcp_metrics import instrumented_tool, register_metrics
+from mcp_progress import report_progress
+from mcp_subscriptions import ResourceSubscriptions
 from bgm_calendar import AnimeCalendarTool
 from typing import Annotated, Literal
 from pydantic import Field
 from enum import IntEnum
 
 mcp = FastMCP("AnimeCalendarTool")
+configure_tracing("mcp_server")
+register_metrics(mcp)
+logger = get_logger("mcp_server")
 
 # 定义星期枚举，提供更好的语义
 class Weekday(IntEnum):
@@ -18,8 +32,16 @@ class Weekday(IntEnum):
 
 anime_tool = AnimeCalendarTool()
 
-@mcp.tool()
-def get_anime_calendar(
+# 只读查询；cacheTtlSeconds 提示客户端可以把结果缓存多久（与服务器端日历缓存一致）
+@mcp.tool(annotations={
+    "readOnlyHint": True,
+    "idempotentHint": True,
+    "openWorldHint": True,
+    "cacheTtlSeconds": anime_tool.cache_ttl,
+})
+@instrumented_tool
+@traced_tool
+async def get_anime_calendar(
     weekday: Annotated[
         Weekday | None,
         Field(
@@ -48,7 +70,8 @@ def get_anime_calendar(
                 }
             }
         )
-    ] = "simple"
+    ] = "simple",
+    ctx: Context | None = None
 ) -> dict:
     """获取番剧每日放送日历信息
     
@@ -59,10 +82,82 @@ def get_anime_calendar(
     - 查询今天的番剧: get_anime_calendar(weekday=当前星期几)
     - 查询全周番剧: get_anime_calendar()
     - 获取详细信息: get_anime_calendar(format="detailed")
+    
+    客户端在请求中带上 progressToken 时，请求上游前先发送一条进度通知。
     """
     # 如果传入的是枚举值，转换为整数
     weekday_int = int(weekday) if weekday is not None else None
-    return anime_tool.execute(weekday=weekday_int, format=format)
+    # 上游请求可能要几百毫秒，先告知客户端已开始处理
+    await report_progress(ctx, 0, message="正在获取 bgm.tv 放送日历…")
+    # 上游请求和格式化在线程中执行，不阻塞事件循环
+    return await anyio.to_thread.run_sync(anime_tool.execute, weekday_int, format)
+
+# 日历资源：整周 anime://calendar/week，单日 anime://calendar/{1-7}
+WEEK_URI = "anime://calendar/week"
+DAY_URI = "anime://calendar/{weekday}"
+
+@mcp.resource(
+    WEEK_URI,
+    name="anime_calendar_week",
+    description="整周番剧放送日历（bgm.tv 原始数据，JSON）",
+    mime_type="application/json"
+)
+async def calendar_week() -> str:
+    calendar_data = await anyio.to_thread.run_sync(anime_tool.get_calendar)
+    return json.dumps(calendar_data, ensure_ascii=False)
+
+@mcp.resource(
+    DAY_URI,
+    name="anime_calendar_day",
+    description="指定星期（1-7，1 为星期一）的番剧放送日历（bgm.tv 原始数据，JSON）",
+    mime_type="application/json"
+)
+async def calendar_day(weekday: str) -> str:
+    weekday = int(weekday)
+    if weekday not in range(1, 8):
+        raise ValueError(f"weekday 应为 1-7，实际为 {weekday}")
+    calendar_data = await anyio.to_thread.run_sync(anime_tool.get_calendar)
+    day = next((day for day in calendar_data if day["weekday"]["id"] == weekday), None)
+    return json.dumps(day, ensure_ascii=False)
+
+# 资源订阅：有订阅者时每 BGM_POLL_INTERVAL 秒（默认与日历缓存时间相同）重新获取上游数据，
+# 只有内容哈希变化的那几天（以及整周资源）才会发送 notifications/resources/updated
+subscriptions = ResourceSubscriptions()
+poll_interval = float(os.environ.get("BGM_POLL_INTERVAL", anime_tool.cache_ttl or 300))
+_poller = None
+
+async def poll_calendar():
+    while subscriptions.active:
+        await anyio.sleep(poll_interval)
+        try:
+            changed = await anyio.to_thread.run_sync(anime_tool.refresh)
+        except Exception as e:
+            logger.warning("刷新番剧日历失败: %s", e)
+            continue
+        if not changed:
+            continue
+        logger.info("番剧日历有变化: %s", sorted(changed))
+        for weekday in sorted(changed):
+            await subscriptions.notify(DAY_URI.format(weekday=weekday))
+        await subscriptions.notify(WEEK_URI)
+
+def start_poller(uri):
+    global _poller
+    if _poller is None or _poller.done():
+        _poller = asyncio.get_running_loop().create_task(poll_calendar())
+
+subscriptions.register(mcp, on_subscribe=start_poller)
 
 if __name__ == "__main__":
-    mcp.run()
+    # 默认 stdio；设置 MCP_TRANSPORT=streamable-http 或 sse 可作为共享远程服务器运行
+    transport = os.environ.get("MCP_TRANSPORT", "stdio")
+    # 再配置一次以移除 fastmcp 导入时挂上的 RichHandler
+    configure_server_logging()
+    if transport == "stdio":
+        mcp.run()
+    else:
+        mcp.run(
+            transport=transport,
+            host=os.environ.get("MCP_HOST", "127.0.0.1"),
+            port=int(os.environ.get("MCP_PORT", "8000"))
+        )
@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# 恢复会话和每轮发送给模型的最大消息条数
+DEFAULT_WINDOW = int(os.environ.get("MCP_HISTORY_WINDOW", "40"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+"""
+
+
+def trim_window(messages, max_messages=DEFAULT_WINDOW):
+    """保留最近 max_messages 条消息，并保证窗口从一条普通用户提问开始
+
+    tool_result 必须紧跟在对应的 tool_use 之后，窗口不能从工具结果或助手回复处截断。
+    窗口内没有普通用户提问时（一轮工具调用超过窗口大小），向前扩展到这一轮的开头。
+    """
+    if len(messages) <= max_messages:
+        return messages
+    start = len(messages) - max_messages
+    turn_start = _turn_start(messages, start)
+    if turn_start is None:
+        turn_start = next((i for i in range(start - 1, -1, -1) if _is_question(messages[i])), 0)
+    return messages[turn_start:]
+
+
+def _is_question(message):
+    return message["role"] == "user" and isinstance(message["content"], str)
+
+
+def _turn_start(messages, start=0):
+    """start 之后第一条普通用户提问的位置，没有时返回 None"""
+    return next((i for i in range(start, len(messages)) if _is_question(messages[i])), None)
+
+
+class ConversationStore:
+    """只追加的会话存储（SQLite WAL 模式）
+
+    每轮对话结束后只写入本轮新增的消息；恢复会话时按 (session_id, seq) 主键
+    倒序读取最近的窗口，耗时只与窗口大小有关，与会话总长度无关。
+    path 默认读取 MCP_STORE_PATH（conversations.db）。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("MCP_STORE_PATH", "conversations.db")
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def create_session(self, title=None):
+        session_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (id, title, created, updated) VALUES (?, ?, ?, ?)",
+                (session_id, title, now, now)
+            )
+        return session_id
+
+    def get_session(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, title, created, updated, message_count FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return _session_dict(row) if row else None
+
+    def list_sessions(self, limit=10):
+        """最近更新的会话"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, created, updated, message_count FROM sessions ORDER BY updated DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [_session_dict(row) for row in rows]
+
+    def append(self, session_id, messages):
+        """在一个事务中追加一轮对话新增的消息"""
+        if not messages:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT message_count, title FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                if row is None:
+                    raise KeyError(f"会话不存在: {session_id}")
+                count, title = row
+                self._conn.executemany(
+                    "INSERT INTO messages (session_id, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (session_id, count + i, message["role"],
+                         json.dumps(message["content"], ensure_ascii=False), now)
+                        for i, message in enumerate(messages)
+                    ]
+                )
+                if title is None:
+                    title = next((m["content"][:40] for m in messages
+                                  if m["role"] == "user" and isinstance(m["content"], str)), None)
+                self._conn.execute(
+                    "UPDATE sessions SET message_count = ?, updated = ?, title = ? WHERE id = ?",
+                    (count + len(messages), now, title, session_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load_window(self, session_id, max_messages=DEFAULT_WINDOW):
+        """读取最近的消息窗口（按时间顺序），只读取窗口内的行"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, max_messages)
+            ).fetchall()
+        messages = [{"role": role, "content": json.loads(content)} for role, content in reversed(rows)]
+        # 读满窗口说明前面还有更早的消息，需要对齐到一轮对话的开头
+        if len(messages) < max_messages:
+            return messages
+        start = _turn_start(messages)
+        if start is not None:
+            return messages[start:]
+        # 窗口内没有普通用户提问（一轮工具调用超过窗口大小），向前扩展到这一轮的开头；
+        # 普通提问的 content 是 JSON 字符串，以引号开头
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? AND seq >= ("
+                "SELECT MAX(seq) FROM messages WHERE session_id = ? AND role = 'user' "
+                "AND substr(content, 1, 1) = '\"') ORDER BY seq",
+                (session_id, session_id)
+            ).fetchall()
+        return [{"role": role, "content": json.loads(content)} for role, content in rows] or messages
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _session_dict(row):
+    session_id, title, created, updated, message_count = row
+    return {
+        "id": session_id,
+        "title": title,
+        "created": created,
+        "updated": updated,
+        "message_count": message_count,
+    }
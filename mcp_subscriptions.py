@@ -0,0 +1,63 @@
+import weakref
+
+from pydantic import AnyUrl
+
+from mcp_logging import get_logger
+
+logger = get_logger("mcp_subscriptions")
+
+
+class ResourceSubscriptions:
+    """服务器端资源订阅
+
+    FastMCP 没有封装 resources/subscribe，这里直接在底层 Server 上注册
+    subscribe/unsubscribe 处理函数，并在 initialize 返回的能力中声明
+    resources.subscribe=true。会话以弱引用保存，断开的会话会自动移除。
+    """
+
+    def __init__(self):
+        self.subscribers = {}  # uri -> WeakSet[ServerSession]
+
+    def register(self, mcp, on_subscribe=None):
+        server = mcp._mcp_server
+
+        @server.subscribe_resource()
+        async def subscribe(uri):
+            uri = str(uri)
+            self.subscribers.setdefault(uri, weakref.WeakSet()).add(server.request_context.session)
+            logger.info("订阅资源 %s", uri)
+            if on_subscribe:
+                on_subscribe(uri)
+
+        @server.unsubscribe_resource()
+        async def unsubscribe(uri):
+            sessions = self.subscribers.get(str(uri))
+            if sessions is not None:
+                sessions.discard(server.request_context.session)
+
+        get_capabilities = server.get_capabilities
+
+        def get_capabilities_with_subscribe(*args, **kwargs):
+            capabilities = get_capabilities(*args, **kwargs)
+            if capabilities.resources is not None:
+                capabilities.resources.subscribe = True
+            return capabilities
+
+        server.get_capabilities = get_capabilities_with_subscribe
+
+    @property
+    def active(self):
+        return any(len(sessions) for sessions in self.subscribers.values())
+
+    async def notify(self, uri):
+        """向订阅了 uri 的会话发送 notifications/resources/updated"""
+        sessions = self.subscribers.get(uri)
+        if not sessions:
+            return
+        for session in list(sessions):
+            try:
+                await session.send_resource_updated(AnyUrl(uri))
+            except Exception as e:
+                # 会话已断开
+                logger.info("通知资源更新失败，移除订阅 %s: %s", uri, e)
+                sessions.discard(session)
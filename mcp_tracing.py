@@ -0,0 +1,358 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+
+import requests
+
+from mcp_logging import get_logger
+
+logger = get_logger("mcp_tracing")
+
+_current_span = contextvars.ContextVar("mcp_current_span", default=None)
+
+
+class Histogram:
+    """HDR 风格的延迟直方图（对数-线性分桶）
+
+    数值按微秒整数记录，小于 2^precision 的值精确计数，更大的值只保留最高
+    precision 位，相对误差不超过 2^-(precision-1)。桶以下界为键存放在字典中，
+    内存占用只与出现过的量级有关。
+    """
+
+    def __init__(self, precision=7):
+        self.precision = precision
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def record(self, value_ms):
+        value = max(0, int(value_ms * 1000))
+        shift = max(0, value.bit_length() - self.precision)
+        bucket = (value >> shift) << shift
+        with self._lock:
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """返回第 p 百分位的毫秒数"""
+        with self._lock:
+            if not self.count:
+                return None
+            target = max(1, round(self.count * p / 100))
+            seen = 0
+            for bucket in sorted(self.buckets):
+                seen += self.buckets[bucket]
+                if seen >= target:
+                    return min(bucket, self.max) / 1000
+            return self.max / 1000
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count / 1000, 3) if self.count else None,
+            "min_ms": self.min / 1000 if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max / 1000 if self.count else None,
+        }
+
+
+class Span:
+    """一次计时操作，字段与 OpenTelemetry span 对齐"""
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._start = time.perf_counter()
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def traceparent(self):
+        """W3C traceparent，用于跨进程传递"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def end(self):
+        if self.end_ns is None:
+            duration_ms = self.duration_ms
+            self.end_ns = time.time_ns()
+            self.tracer._finish(self, duration_ms)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.status = "ERROR"
+            self.attributes["error"] = repr(exc)
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+    def to_dict(self):
+        return {
+            "service": self.tracer.service_name,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+def parse_traceparent(value):
+    """解析 W3C traceparent，返回 (trace_id, parent_span_id)，格式错误时返回 None"""
+    if not isinstance(value, str):
+        return None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+class FileExporter:
+    """把结束的 span 逐行追加到 JSONL 文件（多进程可共用同一个文件）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def shutdown(self):
+        pass
+
+
+class OTLPHttpExporter:
+    """以 OTLP/HTTP JSON 格式批量发送 span 到 collector（后台线程，不阻塞调用方）"""
+
+    def __init__(self, endpoint, service_name, batch_size=64, interval=2.0, max_queue=4096):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.session = requests.Session()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            pass  # collector 跟不上时丢弃，不影响业务请求
+
+    def _run(self):
+        while not self._stopped.is_set() or not self.queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch:
+                self._send(batch)
+
+    def _send(self, spans):
+        def attributes(values):
+            return [{"key": k, "value": {"stringValue": str(v)}} for k, v in values.items()]
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": attributes({"service.name": self.service_name})},
+            "scopeSpans": [{
+                "scope": {"name": "mcp_tracing"},
+                "spans": [{
+                    "traceId": span.trace_id,
+                    "spanId": span.span_id,
+                    "parentSpanId": span.parent_id or "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": attributes(span.attributes),
+                    "status": {"code": 2 if span.status == "ERROR" else 1},
+                } for span in spans]
+            }]
+        }]}
+        try:
+            self.session.post(self.url, json=payload, timeout=5)
+        except requests.RequestException as e:
+            logger.warning("发送 trace 到 collector 失败: %s", e)
+
+    def shutdown(self):
+        self._stopped.set()
+        self._thread.join(timeout=self.interval + 5)
+
+
+class Tracer:
+    """进程内 tracer：为每个 span 名称维护延迟直方图，并把 span 交给导出器"""
+
+    def __init__(self, service_name, exporters=None):
+        self.service_name = service_name
+        self.exporters = list(exporters or [])
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def start_span(self, name, attributes=None, traceparent=None):
+        """创建 span，作为上下文管理器使用
+
+        父 span 优先取显式传入的 traceparent（来自其他进程），否则取当前上下文中的 span。
+        """
+        remote = parse_traceparent(traceparent)
+        if remote:
+            trace_id, parent_id = remote
+        else:
+            parent = _current_span.get()
+            trace_id = parent.trace_id if parent else secrets.token_hex(16)
+            parent_id = parent.span_id if parent else None
+        return Span(self, name, trace_id, parent_id, attributes)
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def record(self, name, value_ms):
+        """直接记录一个延迟值（例如首 token 时间这类不是完整 span 的阶段）"""
+        self.histogram(name).record(value_ms)
+
+    def _finish(self, span, duration_ms):
+        self.record(span.name, duration_ms)
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning("导出 span 失败: %s", e)
+
+    def report(self):
+        """各阶段的延迟统计 {名称: {count, p50_ms, p99_ms, ...}}"""
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def print_report(self):
+        report = self.report()
+        if not report:
+            print("（暂无延迟数据）")
+            return
+        print(f"{'stage':<32}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, s in report.items():
+            print(f"{name:<32}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p90_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+
+    def shutdown(self):
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+_tracer = None
+
+
+def configure_tracing(service_name):
+    """根据环境变量创建全局 tracer
+
+    MCP_TRACE_FILE：span 以 JSONL 追加写入该文件；
+    OTEL_EXPORTER_OTLP_ENDPOINT：以 OTLP/HTTP JSON 发送到 collector。
+    都未设置时只在进程内统计直方图。
+    """
+    global _tracer
+    exporters = []
+    if os.environ.get("MCP_TRACE_FILE"):
+        exporters.append(FileExporter(os.environ["MCP_TRACE_FILE"]))
+    if os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        exporters.append(OTLPHttpExporter(os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"], service_name))
+    _tracer = Tracer(service_name, exporters)
+    return _tracer
+
+
+def get_tracer():
+    """返回全局 tracer，未配置时按默认服务名创建"""
+    if _tracer is None:
+        return configure_tracing("mcp")
+    return _tracer
+
+
+def current_span():
+    return _current_span.get()
+
+
+def inject_meta(params):
+    """把当前 span 的 traceparent 写入 JSON-RPC params._meta（返回新字典，不修改原参数）"""
+    span = _current_span.get()
+    if span is None:
+        return params
+    params = dict(params or {})
+    params["_meta"] = {**params.get("_meta", {}), "traceparent": span.traceparent()}
+    return params
+
+
+def _request_traceparent():
+    """从当前 FastMCP 请求的 _meta 中取 traceparent"""
+    try:
+        from fastmcp.server.dependencies import get_context
+
+        meta = get_context().request_context.meta
+    except (ImportError, LookupError, RuntimeError, ValueError):
+        return None
+    return getattr(meta, "traceparent", None) if meta else None
+
+
+def traced_tool(fn):
+    """MCP 工具装饰器：以客户端传来的 traceparent 为父 span 记录工具执行
+
+    使用 functools.wraps 保留原函数签名，FastMCP 生成的参数 schema 不受影响；
+    需放在 @mcp.tool() 之下。
+    """
+    name = f"tool.{fn.__name__}"
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with get_tracer().start_span(name, traceparent=_request_traceparent()):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with get_tracer().start_span(name, traceparent=_request_traceparent()):
+            return fn(*args, **kwargs)
+    return wrapper